@@ -1,26 +1,82 @@
 """ Main class for aligning single tokens between original and corrected versions of the text """
 
 import Levenshtein
+from functools import cached_property
 from itertools import groupby
 
 from edit import Edit
+from token_store import TokenStore
+
+
+def get_trans_cost(cost_matrix, o_low, c_low, i, j):
+    """ Returns the cost of the cheapest transposition ending at tokens i and j
+    along with its length minus one, or infinity if there is none """
+    # Differences between token counts in o_low[i - k:i + 1] and c_low[j - k:j + 1],
+    # updated as k grows; the spans are permutations of each other when all of them are zero
+    counts = {o_low[i]: 1}
+    counts[c_low[j]] = counts.get(c_low[j], 0) - 1
+    unequal = sum(1 for n in counts.values() if n)
+    k = 1
+    while i - k >= 0 and j - k >= 0 and \
+            cost_matrix[i - k + 1][j - k + 1] != cost_matrix[i - k][j - k]:
+        for tok, diff in ((o_low[i - k], 1), (c_low[j - k], -1)):
+            n = counts.get(tok, 0)
+            counts[tok] = n + diff
+            unequal += (n + diff != 0) - (n != 0)
+        if not unequal:
+            return cost_matrix[i - k][j - k] + k, k
+        k += 1
+    return float("inf"), k
 
 
 class Alignment:
 
-    def __init__(self, orig, cor):
+    def __init__(self, orig, cor, engine="python", trim=True, sub_costs=None):
+        """ engine selects the implementation of the dynamic programming:
+        python (default) or numpy, which is faster on long texts. Both give the same results.
+        With trim, the common prefix and suffix of the texts are matched without the dynamic
+        programming, and the matrices only cover the tokens between them.
+        The alignment is the same as without trimming.
+        sub_costs is a dict shared by alignments of the same original with different corrections,
+        in which the python engine keeps the substitution costs of every original token """
         self.orig = orig.tokens
         self.cor = cor.tokens
-        self.cost_matrix, self.op_matrix = self.align()
+        self.sub_costs = sub_costs
+        self.prefix, self.suffix = self.get_common_affixes() if trim else (0, 0)
+        o_core = self.orig[self.prefix:len(self.orig) - self.suffix]
+        c_core = self.cor[self.prefix:len(self.cor) - self.suffix]
+        if engine == "numpy":
+            from numpy_alignment import align
+            self.cost_matrix, self.op_matrix = align(o_core, c_core)
+        elif engine == "python":
+            self.cost_matrix, self.op_matrix = self.align(o_core, c_core)
+        else:
+            raise Exception("Unknown alignment engine. Choose from: python, numpy.")
         self.align_seq = self.get_cheapest_align_seq()
 
-    def align(self):
+    def get_common_affixes(self):
+        """ Returns the lengths of the longest common prefix and suffix of the token sequences """
+        max_len = min(len(self.orig), len(self.cor))
+        prefix = 0
+        while prefix < max_len and self.orig[prefix].text == self.cor[prefix].text:
+            prefix += 1
+        suffix = 0
+        while suffix < max_len - prefix and \
+                self.orig[-suffix - 1].text == self.cor[-suffix - 1].text:
+            suffix += 1
+        return prefix, suffix
+
+    def align(self, orig, cor):
         """ Builds a cost and operation matrices to be used later in the alignment algorithm """
 
-        o_len = len(self.orig)
-        c_len = len(self.cor)
-        o_low = [o.text.lower() for o in self.orig]
-        c_low = [c.text.lower() for c in self.cor]
+        o_len = len(orig)
+        c_len = len(cor)
+        o_low = [o.text.lower() for o in orig]
+        c_low = [c.text.lower() for c in cor]
+        if self.sub_costs is not None:
+            # Rows of substitution costs of the original tokens by the corrected token
+            sub_cost_rows = [self.sub_costs.setdefault(self.prefix + i, {}) for i in range(o_len)]
+            c_keys = [(c.text, c.lemma, c.pos) for c in cor]
 
         # Cost matrix contains the costs of operations between tokens in the original and corrected texts
         cost_matrix = [[0.0 for j in range(c_len + 1)] for i in range(o_len + 1)]
@@ -38,25 +94,21 @@ class Alignment:
         # Loop through the matrix, selecting optimal operations between every pair of tokens
         for i in range(o_len):
             for j in range(c_len):
-                if self.orig[i].text == self.cor[j].text:
+                if orig[i].text == cor[j].text:
                     cost_matrix[i + 1][j + 1] = cost_matrix[i][j]
                     op_matrix[i + 1][j + 1] = "M"
                 else:
                     # Calculate costs of every operation
                     del_cost = cost_matrix[i][j + 1] + 1
                     ins_cost = cost_matrix[i + 1][j] + 1
-                    trans_cost = float("inf")
-                    sub_cost = cost_matrix[i][j] + \
-                        self.get_sub_cost(self.orig[i], self.cor[j])
-
-                    # Transposition cost calculation
-                    k = 1
-                    while i - k >= 0 and j - k >= 0 and \
-                            cost_matrix[i - k + 1][j - k + 1] != cost_matrix[i - k][j - k]:
-                        if sorted(o_low[i - k:i + 1]) == sorted(c_low[j - k:j + 1]):
-                            trans_cost = cost_matrix[i - k][j - k] + k
-                            break
-                        k += 1
+                    if self.sub_costs is None:
+                        sub_cost = cost_matrix[i][j] + self.get_sub_cost(orig[i], cor[j])
+                    else:
+                        row = sub_cost_rows[i]
+                        if c_keys[j] not in row:
+                            row[c_keys[j]] = self.get_sub_cost(orig[i], cor[j])
+                        sub_cost = cost_matrix[i][j] + row[c_keys[j]]
+                    trans_cost, k = get_trans_cost(cost_matrix, o_low, c_low, i, j)
 
                     # Select the operation with the cheapest cost
                     costs = [trans_cost, sub_cost, ins_cost, del_cost]
@@ -89,35 +141,74 @@ class Alignment:
 
     def get_cheapest_align_seq(self):
         """ Align the tokens by selecting the optimal operation in the cost matrix """
+        # The common suffix is always matched
+        o_end = len(self.orig) - self.suffix
+        c_end = len(self.cor) - self.suffix
+        align_seq = [("M", o_end + n, o_end + n + 1, c_end + n, c_end + n + 1)
+                     for n in reversed(range(self.suffix))]
+
+        # The matrices start after the common prefix
         i = len(self.op_matrix) - 1
         j = len(self.op_matrix[0]) - 1
-        align_seq = []
-        while i + j != 0:
+        p = self.prefix
+        while i > 0 and j > 0:
             op = self.op_matrix[i][j]
             if op in {"M", "S"}:
-                align_seq.append((op, i - 1, i, j - 1, j))
+                align_seq.append((op, p + i - 1, p + i, p + j - 1, p + j))
                 i -= 1
                 j -= 1
             elif op == "D":
-                align_seq.append((op, i - 1, i, j, j))
+                align_seq.append((op, p + i - 1, p + i, p + j, p + j))
                 i -= 1
             elif op == "I":
-                align_seq.append((op, i, i, j - 1, j))
+                align_seq.append((op, p + i, p + i, p + j - 1, p + j))
                 j -= 1
             else:
                 k = int(op[1:])
-                align_seq.append((op, i - k, i, j - k, j))
+                align_seq.append((op, p + i - k, p + i, p + j - k, p + j))
                 i -= k
                 j -= k
+
+        # Within the rows and columns of the prefix, the cost of a cell is the difference
+        # of its indices, so the full cost matrix would select these operations
+        i += p
+        j += p
+        while i + j != 0:
+            if i == j or (i > 0 and j > 0 and self.orig[i - 1].text == self.cor[j - 1].text):
+                op = "M"
+            elif i > 0 and j > 0 and self.orig[i - 1].text.lower() == self.cor[j - 1].text.lower():
+                op = "S"
+            else:
+                op = "I" if j > i else "D"
+            if op in {"M", "S"}:
+                align_seq.append((op, i - 1, i, j - 1, j))
+                i -= 1
+                j -= 1
+            elif op == "D":
+                align_seq.append((op, i - 1, i, j, j))
+                i -= 1
+            else:
+                align_seq.append((op, i, i, j - 1, j))
+                j -= 1
         align_seq.reverse()
         return align_seq
 
+    @cached_property
+    def o_store(self):
+        """ Tokens of the original text shared by the edits """
+        return TokenStore(self.orig)
+
+    @cached_property
+    def c_store(self):
+        """ Tokens of the corrected text shared by the edits """
+        return TokenStore(self.cor)
+
     def get_all_split_edits(self):
         """ all-split merge algorithm. i.e. don't merge any edits"""
         edits = []
         for align in self.align_seq:
             if align[0] != "M":
-                edits.append(Edit(self.orig, self.cor, align[1:]))
+                edits.append(Edit(self.o_store, self.c_store, align[1:]))
         return edits
 
     def get_all_merge_edits(self):
@@ -127,7 +218,7 @@ class Alignment:
                                  lambda x: True if x[0] == "M" else False):
             if not op:
                 merged = self.merge_edits(list(group))
-                edits.append(Edit(self.orig, self.cor, merged[0][1:]))
+                edits.append(Edit(self.o_store, self.c_store, merged[0][1:]))
         return edits
 
     def get_all_equal_edits(self):
@@ -136,7 +227,7 @@ class Alignment:
         for op, group in groupby(self.align_seq, lambda x: x[0]):
             if op != "M":
                 merged = self.merge_edits(list(group))
-                edits.append(Edit(self.orig, self.cor, merged[0][1:]))
+                edits.append(Edit(self.o_store, self.c_store, merged[0][1:]))
         return edits
 
     def merge_edits(self, seq):
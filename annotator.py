@@ -1,28 +1,97 @@
 from alignment import Alignment
 from text_processor import TextProcessor
 from merger import get_rule_edits
-from classifier import classify
+import classifier
+import resources
+from token_store import TokenStore
+import time
 
 
 class Annotator:
     """ Main class for the tool. Combines other classes into easy-to-use pipelines """
 
-    def __init__(self):
-        self.processor = TextProcessor()
+    def __init__(self, cache_size=0, engine="python", store=None, document=False):
+        # store is the path of an on-disk store of processed docs, see doc_store.DocStore
+        self.processor = TextProcessor(cache_size, store)
+        # Implementation of the alignment dynamic programming: python or numpy
+        self.engine = engine
+        # Align long texts in chunks between anchors, see document_alignment.DocumentAlignment
+        self.document = document
+        # Instrumentation callbacks, see add_hook
+        self.hooks = []
+
+    def warmup(self):
+        """ Loads all the models and dictionaries now instead of on first use.
+        Returns the loading time in seconds of every resource, see also resources.startup_report """
+        self.processor.warmup()
+        classifier.get_morph_analyzer()
+        classifier.get_stemmer()
+        if classifier.ML:
+            from morph_ortho import get_model
+            get_model()
+        return dict(resources.load_times)
+
+    def add_hook(self, hook):
+        """ Calls hook(stage, seconds, counts) after every stage: process, align, merge and classify
+        of a text, pair or edit, and process_batch and classify_batch of annotate_batch, annotate_many
+        and sessions.
+        counts has the number of tokens of the stage and, for merge, the number of edits.
+        Stages are not timed while there are no hooks. See metrics.MetricsRegistry """
+        self.hooks.append(hook)
+        return hook
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def emit(self, stage, start, **counts):
+        seconds = time.perf_counter() - start
+        for hook in self.hooks:
+            hook(stage, seconds, counts)
 
     def process(self, text):
         """ Preprocesses text and adds additional metadata to it """
-        return self.processor.process(text)
+        if not self.hooks:
+            return self.processor.process(text)
+        start = time.perf_counter()
+        doc = self.processor.process(text)
+        self.emit("process", start, tokens=len(doc.tokens))
+        return doc
+
+    def process_batch(self, texts, batch_size=64):
+        """ Preprocesses texts, batch_size at a time, see TextProcessor.process_batch """
+        if not self.hooks:
+            return self.processor.process_batch(texts, batch_size)
+        start = time.perf_counter()
+        docs = self.processor.process_batch(texts, batch_size)
+        self.emit("process_batch", start, tokens=sum(len(doc.tokens) for doc in docs))
+        return docs
 
     def align(self, orig, corr):
         """ Aligns single-token edits """
         orig = self.process(orig)
         corr = self.process(corr)
-        return Alignment(orig, corr)
+        return self.align_docs(orig, corr)
+
+    def align_docs(self, orig, corr, sub_costs=None):
+        """ Aligns processed texts. sub_costs is shared by the alignments of one original,
+        see Alignment; document alignment does not use it """
+        if not self.hooks:
+            return self.create_alignment(orig, corr, sub_costs)
+        start = time.perf_counter()
+        alignment = self.create_alignment(orig, corr, sub_costs)
+        self.emit("align", start, tokens=len(orig.tokens) + len(corr.tokens))
+        return alignment
+
+    def create_alignment(self, orig, corr, sub_costs=None):
+        if self.document:
+            from document_alignment import DocumentAlignment
+            return DocumentAlignment(orig, corr, self.engine)
+        return Alignment(orig, corr, self.engine, sub_costs=sub_costs)
 
     def merge(self, alignment, algorithm="rules"):
         """ Merges extracted single-token edits based on an algorithm specified.
          Can use following algorithms: rules, all-split, all-merge, all-equal"""
+        start = time.perf_counter() if self.hooks else None
         if algorithm == "rules":
             # Merge based on a set of strict rules
             edits = get_rule_edits(alignment)
@@ -38,11 +107,28 @@ class Annotator:
         else:
             raise Exception("Unknown merging algorithm. Choose from: "
                             "rules, all-split, all-merge, all-equal.")
+        if start is not None:
+            self.emit("merge", start, tokens=len(alignment.orig) + len(alignment.cor), edits=len(edits))
         return edits
 
     def classify(self, edit):
         """ Assigns a class to a passed edit object """
-        return classify(edit)
+        if not self.hooks:
+            return classifier.classify(edit)
+        start = time.perf_counter()
+        edit = classifier.classify(edit)
+        self.emit("classify", start, tokens=(edit.o_end - edit.o_start) + (edit.c_end - edit.c_start))
+        return edit
+
+    def classify_batch(self, edits):
+        """ Assigns classes to a list of edits together, see classifier.classify_batch """
+        if not self.hooks:
+            return classifier.classify_batch(edits)
+        start = time.perf_counter()
+        classifier.classify_batch(edits)
+        self.emit("classify_batch", start,
+                  tokens=sum(e.o_end - e.o_start + e.c_end - e.c_start for e in edits))
+        return edits
 
     def annotate(self, orig, cor, merging="rules"):
         """
@@ -54,3 +140,47 @@ class Annotator:
         for edit in edits:
             edit = self.classify(edit)
         return edits
+
+    def session(self, merging="rules"):
+        """ Returns a session.AnnotationSession for re-annotating a text and its correction
+        after every change, which only annotates the changed sentences again """
+        from session import AnnotationSession
+        return AnnotationSession(self, merging)
+
+    def annotate_many(self, orig, cors, merging="rules"):
+        """
+        Annotates several corrections of the same original, e.g. by different annotators.
+        The original is processed once, and its tokens and substitution costs are shared
+        by all the alignments. Returns a list of edit lists, one per correction.
+        """
+        docs = self.process_batch([orig] + list(cors))
+        orig = docs[0]
+        o_store = TokenStore(orig.tokens)
+        sub_costs = {}
+        results = []
+        for cor in docs[1:]:
+            alignment = self.align_docs(orig, cor, sub_costs)
+            # Edits of all the corrections share the token store of the original
+            alignment.o_store = o_store
+            results.append(self.merge(alignment, merging))
+        self.classify_batch([edit for edits in results for edit in edits])
+        return results
+
+    def annotate_batch(self, pairs, batch_size=64, merging="rules"):
+        """
+        Annotates a sequence of (original, corrected) pairs. Texts of batch_size pairs
+        are tagged and parsed together, then every pair is aligned, merged and classified.
+        Returns a list of edit lists, one per pair.
+        """
+        pairs = list(pairs)
+        results = []
+        for start in range(0, len(pairs), batch_size):
+            batch = pairs[start:start + batch_size]
+            docs = self.process_batch([text for pair in batch for text in pair], batch_size)
+            batch_results = [self.merge(self.align_docs(orig, cor), merging)
+                             for orig, cor in zip(docs[::2], docs[1::2])]
+            # Edits of the whole batch are classified together to batch the ML classifier
+            edits = [edit for edits in batch_results for edit in edits]
+            self.classify_batch(edits)
+            results += batch_results
+        return results
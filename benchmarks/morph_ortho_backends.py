@@ -0,0 +1,76 @@
+""" Agreement, latency and memory of the morph_ortho inference backends on a held-out set
+of (quote, correction) pairs, one pair per line separated by a tab. Every backend runs in
+its own process, and its labels are compared with those of the reference torch model.
+Run from the repository root: python -m benchmarks.morph_ortho_backends heldout.tsv """
+
+import argparse
+import multiprocessing
+import resource
+import sys
+import time
+
+import morph_ortho
+
+
+def evaluate(backend, pairs, batch_size, latency_pairs):
+    """ Labels of the pairs, mean latency of single-pair calls, batched time per pair
+    and peak resident memory in MB """
+    morph_ortho.backend = backend
+    morph_ortho.get_model()
+    start = time.perf_counter()
+    for pair in pairs[:latency_pairs]:
+        morph_ortho.run_model([pair])
+    latency = (time.perf_counter() - start) / max(1, min(latency_pairs, len(pairs)))
+    start = time.perf_counter()
+    labels = morph_ortho.run_model(pairs, batch_size)
+    batched = (time.perf_counter() - start) / max(1, len(pairs))
+    memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return labels, latency, batched, memory
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("pairs", help="Held-out set: quote<TAB>correction lines")
+    parser.add_argument("--backends", nargs="+", default=["quantized", "onnx"],
+                        choices=["quantized", "onnx"])
+    parser.add_argument("--export", action="store_true",
+                        help="Export the ONNX graph before evaluating the onnx backend")
+    parser.add_argument("--quantize-onnx", action="store_true",
+                        help="Store int8 weights in the exported ONNX graph")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--latency-pairs", type=int, default=200,
+                        help="Number of pairs run one by one to measure latency")
+    parser.add_argument("--min-agreement", type=float, default=0.99)
+    args = parser.parse_args()
+
+    # Imported here, so that the spawned workers measuring memory do not load natasha
+    from cli import read_tsv
+    with open(args.pairs, encoding="utf-8") as f:
+        pairs = list(read_tsv(f))
+    if args.export and "onnx" in args.backends:
+        morph_ortho.export_onnx(quantize=args.quantize_onnx)
+
+    # A fresh process per backend, so that the memory of one model does not count for another
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for backend in ["torch"] + args.backends:
+        with context.Pool(1) as pool:
+            results[backend] = pool.apply(evaluate, (backend, pairs, args.batch_size,
+                                                     args.latency_pairs))
+
+    reference = results["torch"][0]
+    ok = True
+    print("%-10s %10s %12s %12s %10s %9s" % ("backend", "agreement", "latency, ms",
+                                               "batched, ms", "memory, MB", "speedup"))
+    for backend, (labels, latency, batched, memory) in results.items():
+        agreement = sum(a == b for a, b in zip(labels, reference)) / max(1, len(pairs))
+        print("%-10s %10.4f %12.2f %12.2f %10.0f %8.1fx" % (
+            backend, agreement, latency * 1000, batched * 1000, memory,
+            results["torch"][1] / latency if latency else 0))
+        ok = ok and agreement >= args.min_agreement
+    if not ok:
+        sys.exit("agreement below %s" % args.min_agreement)
+
+
+if __name__ == "__main__":
+    main()
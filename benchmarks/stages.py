@@ -0,0 +1,264 @@
+""" Benchmark of the stages of the annotator: TextProcessor.process, Alignment, every merging
+algorithm of Annotator.merge and classification, timed separately on synthetic pairs across
+sentence lengths, edit densities and word-order-heavy cases, and on pairs sampled from a file
+with one (original, corrected) pair per line separated by a tab.
+Reports throughput, p50/p99 latency and peak memory of every stage, and compares them
+with a saved baseline to flag regressions.
+Run from the repository root: python -m benchmarks.stages --sample pairs.tsv --save baseline.json
+then after a change: python -m benchmarks.stages --sample pairs.tsv --baseline baseline.json """
+
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+import classifier
+from alignment import Alignment
+from annotator import Annotator
+from cli import read_tsv
+
+merging_algorithms = ["rules", "all-split", "all-merge", "all-equal"]
+stages = ["process", "align"] + ["merge:" + algorithm for algorithm in merging_algorithms] + ["classify"]
+
+# Memoized helpers of the classifier, cleared before every run of the classify stage with --cold
+classifier_caches = ["parse", "stem", "ordered_related_stems", "get_lexeme_forms",
+                     "get_possible_aspects", "get_adjective_parses"]
+
+# Correct sentences the synthetic pairs are made of
+sentences = [
+    "Этот вопрос кажется мне очень важным для нашего общества.",
+    "Она сказала, что придёт завтра утром, если не будет дождя.",
+    "В прошлом году мы ездили на море вместе с родителями.",
+    "Мой старший брат работает инженером на большом заводе.",
+    "Студенты долго обсуждали новую книгу известного писателя.",
+    "Когда я был маленьким, я часто гулял с собакой в парке.",
+    "Русский язык считается одним из самых трудных языков мира.",
+    "Вчера вечером мы смотрели интересный фильм о космосе.",
+    "Учительница попросила детей написать короткое сочинение.",
+    "На выходных я собираюсь навестить свою бабушку в деревне.",
+]
+
+
+def misspell(word):
+    """ The word with one letter deleted, doubled or replaced """
+    if len(word) < 3 or not word.isalpha():
+        return word
+    n = random.randrange(1, len(word))
+    change = random.choice(["delete", "double", "replace"])
+    if change == "delete":
+        return word[:n] + word[n + 1:]
+    if change == "double":
+        return word[:n] + word[n] + word[n:]
+    return word[:n] + random.choice("аеиоуыя") + word[n + 1:]
+
+
+def corrupt(words, density):
+    """ An original for the corrected words with about density edits per word """
+    orig = []
+    for word in words:
+        if random.random() >= density:
+            orig.append(word)
+            continue
+        change = random.choice(["misspell", "delete", "insert", "lowercase"])
+        if change == "misspell":
+            orig.append(misspell(word))
+        elif change == "insert":
+            orig += [word, random.choice(["и", "в", "на", "не", "же"])]
+        elif change == "lowercase":
+            orig.append(word.lower())
+    return orig
+
+
+def reorder(words, window):
+    """ The words with every other window of words shuffled """
+    words = list(words)
+    for start in range(0, len(words), window * 2):
+        part = words[start:start + window]
+        random.shuffle(part)
+        words[start:start + window] = part
+    return words
+
+
+def synthetic_cases(lengths, densities, pairs):
+    """ Cases of corrected texts of about the given lengths in words with edits
+    at every density, and with word order changes """
+    cases = {}
+    for length in lengths:
+        texts = []
+        for _ in range(pairs):
+            words = []
+            while len(words) < length:
+                words += random.choice(sentences).split()
+            texts.append(words)
+        for density in densities:
+            cases["synthetic/%d/%s" % (length, density)] = [
+                (" ".join(corrupt(words, density)), " ".join(words)) for words in texts]
+        cases["synthetic/%d/word-order" % length] = [
+            (" ".join(reorder(words, 4)), " ".join(words)) for words in texts]
+    return cases
+
+
+def sampled_cases(path, lengths, pairs):
+    """ Pairs of the file grouped by the length of the original in words into buckets
+    bounded by the given lengths """
+    cases = {}
+    bounds = sorted(lengths)
+    with open(path, encoding="utf-8") as f:
+        for orig, cor in read_tsv(f):
+            n = len(orig.split())
+            bucket = next((bound for bound in bounds if n <= bound), "longer")
+            cases.setdefault("sampled/%s" % bucket, []).append((orig, cor))
+    return {name: random.sample(case, min(pairs, len(case))) for name, case in sorted(cases.items())}
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))] if values else 0.0
+
+
+def measure(calls, repeat):
+    """ Runs every call repeat times. Returns the latencies of the calls in seconds
+    and the peak memory in bytes allocated by one more run under tracemalloc """
+    latencies = []
+    for _ in range(repeat):
+        for call in calls:
+            start = time.perf_counter()
+            call()
+            latencies.append(time.perf_counter() - start)
+    tracemalloc.start()
+    for call in calls:
+        call()
+    memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return latencies, memory
+
+
+def stats(latencies, memory):
+    total = sum(latencies)
+    return {"calls": len(latencies), "throughput": len(latencies) / total if total else 0.0,
+            "p50": percentile(latencies, 0.5), "p99": percentile(latencies, 0.99), "memory": memory}
+
+
+def run_case(annotator, pairs, repeat, cold):
+    """ Statistics of every stage on the pairs of one case """
+    results = {}
+    texts = [text for pair in pairs for text in pair]
+    results["process"] = stats(*measure([lambda text=text: annotator.process(text) for text in texts],
+                                        repeat))
+
+    docs = [(annotator.process(orig), annotator.process(cor)) for orig, cor in pairs]
+    results["align"] = stats(*measure([lambda orig=orig, cor=cor: Alignment(orig, cor, annotator.engine)
+                                       for orig, cor in docs], repeat))
+
+    edits = []
+    for algorithm in merging_algorithms:
+        # Every run gets new alignments, so that the token stores built by merging are not shared
+        latencies = []
+        memory = 0
+        for _ in range(repeat):
+            alignments = [Alignment(orig, cor, annotator.engine) for orig, cor in docs]
+            run_latencies, run_memory = measure([lambda a=a: annotator.merge(a, algorithm)
+                                                 for a in alignments], 1)
+            latencies += run_latencies
+            memory = max(memory, run_memory)
+        results["merge:" + algorithm] = stats(latencies, memory)
+        if algorithm == "rules":
+            edits = [edit for a in alignments for edit in annotator.merge(a, algorithm)]
+
+    if cold:
+        for name in classifier_caches:
+            getattr(classifier, name).cache_clear()
+        # Only the first run is cold
+        repeat = 1
+    results["classify"] = stats(*measure([lambda edit=edit: annotator.classify(edit) for edit in edits],
+                                         repeat))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """ Returns the stages slower than in the baseline by more than tolerance,
+    as (case, stage, metric, baseline value, value) """
+    regressions = []
+    for case, case_results in results.items():
+        for stage, stage_results in case_results.items():
+            base = baseline.get(case, {}).get(stage)
+            if not base:
+                continue
+            for metric in ["p50", "p99", "memory"]:
+                if base[metric] and stage_results[metric] > base[metric] * (1 + tolerance):
+                    regressions.append((case, stage, metric, base[metric], stage_results[metric]))
+            if base["throughput"] and stage_results["throughput"] < base["throughput"] / (1 + tolerance):
+                regressions.append((case, stage, "throughput", base["throughput"],
+                                    stage_results["throughput"]))
+    return regressions
+
+
+def report(results, baseline):
+    lines = ["%-28s %-16s %8s %12s %10s %10s %10s %9s" % (
+        "case", "stage", "calls", "calls/s", "p50, ms", "p99, ms", "peak, KB", "p50 diff")]
+    for case, case_results in results.items():
+        for stage in stages:
+            stage_results = case_results[stage]
+            base = baseline.get(case, {}).get(stage)
+            diff = ("%+8.1f%%" % ((stage_results["p50"] / base["p50"] - 1) * 100)
+                    if base and base["p50"] else "")
+            lines.append("%-28s %-16s %8d %12.1f %10.3f %10.3f %10.0f %9s" % (
+                case, stage, stage_results["calls"], stage_results["throughput"],
+                stage_results["p50"] * 1000, stage_results["p99"] * 1000,
+                stage_results["memory"] / 1024, diff))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sample", help="Pairs to sample from: original<TAB>corrected lines")
+    parser.add_argument("--no-synthetic", action="store_true", help="Only run the sampled pairs")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 30, 100],
+                        help="Lengths in words of the synthetic texts and bounds of the sampled buckets")
+    parser.add_argument("--densities", type=float, nargs="+", default=[0.05, 0.2],
+                        help="Share of the words with an edit in the synthetic pairs")
+    parser.add_argument("--pairs", type=int, default=20, help="Pairs per case")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--engine", choices=["python", "numpy"], default="python")
+    parser.add_argument("--cold", action="store_true",
+                        help="Clear the caches of the classifier before classifying every case")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="Write the results to a JSON file to be used as a baseline")
+    parser.add_argument("--baseline", help="Compare with the results saved by --save")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Relative slowdown over the baseline reported as a regression")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    cases = {}
+    if not args.no_synthetic:
+        cases.update(synthetic_cases(args.lengths, args.densities, args.pairs))
+    if args.sample:
+        cases.update(sampled_cases(args.sample, args.lengths, args.pairs))
+    if not cases:
+        sys.exit("Nothing to run: pass --sample or drop --no-synthetic")
+
+    annotator = Annotator(engine=args.engine)
+    annotator.warmup()
+    results = {name: run_case(annotator, pairs, args.repeat, args.cold) for name, pairs in cases.items()}
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print(report(results, baseline))
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("\nRegressions over %.0f%%:" % (args.tolerance * 100))
+        for case, stage, metric, base, value in regressions:
+            print("%-28s %-16s %-10s %12.6g -> %12.6g" % (case, stage, metric, base, value))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
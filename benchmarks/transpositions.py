@@ -0,0 +1,78 @@
+""" Benchmark of the transposition search in Alignment on word-order-heavy pairs.
+Compares the incremental token counts of get_trans_cost with sorting the spans at every step.
+Run from the repository root: python -m benchmarks.transpositions """
+
+import argparse
+import random
+import time
+
+import alignment
+from alignment import Alignment
+
+
+class Token:
+    def __init__(self, text):
+        self.text = text
+        self.lemma = text.lower()
+        self.pos = "PUNCT" if not text.isalnum() else "X"
+
+
+class Doc:
+    def __init__(self, words):
+        self.tokens = [Token(word) for word in words]
+
+
+def sorted_trans_cost(cost_matrix, o_low, c_low, i, j):
+    """ Transposition search comparing sorted spans at every step """
+    k = 1
+    while i - k >= 0 and j - k >= 0 and \
+            cost_matrix[i - k + 1][j - k + 1] != cost_matrix[i - k][j - k]:
+        if sorted(o_low[i - k:i + 1]) == sorted(c_low[j - k:j + 1]):
+            return cost_matrix[i - k][j - k] + k, k
+        k += 1
+    return float("inf"), k
+
+
+def reordered_pair(length, clause_length, vocab_size):
+    """ A sentence and its version with clauses in a different order and words shuffled within them """
+    words = ["w%d" % random.randrange(vocab_size) for _ in range(length)]
+    clauses = [words[n:n + clause_length] for n in range(0, length, clause_length)]
+    random.shuffle(clauses)
+    for clause in clauses[::2]:
+        random.shuffle(clause)
+    return words, [word for clause in clauses for word in clause]
+
+
+def run(pairs, engine, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        seqs = [Alignment(Doc(orig), Doc(cor), engine).align_seq for orig, cor in pairs]
+    return (time.perf_counter() - start) / repeat, seqs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[20, 50, 100, 200])
+    parser.add_argument("--clause-length", type=int, default=6)
+    parser.add_argument("--vocab-size", type=int, default=30)
+    parser.add_argument("--pairs", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--engine", choices=["python", "numpy"], default="python")
+    args = parser.parse_args()
+
+    random.seed(0)
+    current = alignment.get_trans_cost
+    print("%8s %12s %12s %8s" % ("tokens", "sorted, s", "counts, s", "speedup"))
+    for length in args.lengths:
+        pairs = [reordered_pair(length, args.clause_length, args.vocab_size)
+                 for _ in range(args.pairs)]
+        alignment.get_trans_cost = sorted_trans_cost
+        old_time, old_seqs = run(pairs, "python", args.repeat)
+        alignment.get_trans_cost = current
+        new_time, new_seqs = run(pairs, args.engine, args.repeat)
+        assert old_seqs == new_seqs, "alignments differ"
+        print("%8d %12.4f %12.4f %7.1fx" % (length, old_time, new_time, old_time / new_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,20 +2,43 @@
 import token
 
 import Levenshtein
-import pymorphy3
 import re
 
+from functools import cached_property, lru_cache
 from Levenshtein import distance, ratio as lev
-from nltk.stem.snowball import SnowballStemmer
+from pymorphy3.units import DictionaryAnalyzer
+
+from resources import load
 
 ML = False
 # ML = True
 
-if ML:
-    from morph_ortho import is_morph
 
-pymorphy_parser = pymorphy3.MorphAnalyzer()
-stemmer = SnowballStemmer('russian')
+@lru_cache(maxsize=None)
+def get_morph_analyzer():
+    """ pymorphy analyzer, loaded on first use """
+    def create():
+        import pymorphy3
+        return pymorphy3.MorphAnalyzer()
+    return load("pymorphy3.MorphAnalyzer", create)
+
+
+@lru_cache(maxsize=None)
+def get_stemmer():
+    """ Snowball stemmer, loaded on first use """
+    def create():
+        from nltk.stem.snowball import SnowballStemmer
+        return SnowballStemmer('russian')
+    return load("SnowballStemmer", create)
+
+
+def __getattr__(name):
+    # The analyzer and the stemmer used to be module attributes
+    if name == "pymorphy_parser":
+        return get_morph_analyzer()
+    if name == "stemmer":
+        return get_stemmer()
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
 
 latin_to_cyrillic = {
@@ -27,22 +50,54 @@ latin_to_cyrillic = {
 }
 lat2cyr = re.compile('|'.join(re.escape(key) for key in latin_to_cyrillic.keys()))
 
+@lru_cache(maxsize=200000)
+def parse(word):
+    """ Memoized pymorphy analysis, all the helpers below go through it.
+    The parses are shared between callers and must not be modified """
+    return tuple(get_morph_analyzer().parse(word))
+
+
+@lru_cache(maxsize=200000)
+def stem(word):
+    """ Memoized Snowball stem """
+    return get_stemmer().stem(word)
+
+
+def lru_cache_info(function):
+    info = function.cache_info()
+    calls = info.hits + info.misses
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize,
+            "max_size": info.maxsize, "hit_rate": info.hits / calls if calls else 0.0}
+
+
+def analysis_cache_info():
+    """ Returns hit and miss counts of the pymorphy analysis cache """
+    return lru_cache_info(parse)
+
+
+def cache_info():
+    """ Returns hit and miss counts of the memoized analyses, stems, stem relations and lexemes """
+    return {"parse": lru_cache_info(parse), "stem": lru_cache_info(stem),
+            "related_stems": lru_cache_info(ordered_related_stems),
+            "lexeme_forms": lru_cache_info(get_lexeme_forms)}
+
+
 def get_normal_form(word):
-    return pymorphy_parser.parse(word)[0].normal_form
+    return parse(word)[0].normal_form
 
 
 def get_pos(word, min_score=-1):
-    p = pymorphy_parser.parse(word)[0]
+    p = parse(word)[0]
     return p.tag.POS if p.score > min_score else None
 
 
 def get_number(word):
-    return pymorphy_parser.parse(word)[0].tag.number
+    return parse(word)[0].tag.number
 
 
 def get_gender(word):
     first = True
-    for p in pymorphy_parser.parse(word):
+    for p in parse(word):
         if first or p.score > 0.001:
             if p.tag.gender:
                 return p.tag.gender
@@ -53,12 +108,13 @@ def get_gender(word):
 
 
 def get_tense(verb):
-    return pymorphy_parser.parse(verb)[0].tag.tense
+    return parse(verb)[0].tag.tense
 
 
+@lru_cache(maxsize=200000)
 def get_possible_aspects(verb):
-    aspects = [p.tag.aspect for p in pymorphy_parser.parse(verb) if p.tag.aspect]
-    return list(dict.fromkeys(aspects))  # remove duplicates
+    aspects = [p.tag.aspect for p in parse(verb) if p.tag.aspect]
+    return tuple(dict.fromkeys(aspects))  # remove duplicates
 
 
 def get_aspect(verb):
@@ -66,26 +122,84 @@ def get_aspect(verb):
     return aspects[0] if aspects else None
 
 
+@lru_cache(maxsize=None)
+def get_paradigm_affixes(para_id):
+    """ Prefixes and suffixes of the forms of a pymorphy dictionary paradigm """
+    dictionary = get_morph_analyzer().dictionary
+    paradigm = dictionary.paradigms[para_id]
+    size = len(paradigm) // 3
+    return tuple((dictionary.paradigm_prefixes[paradigm[size * 2 + n]], dictionary.suffixes[paradigm[n]])
+                 for n in range(size))
+
+
+def get_parse_lexeme_forms(p):
+    """ Words of p.lexeme. Lexemes of dictionary words are built from the paradigm
+    directly, without creating a parse for every form """
+    method = p.methods_stack[0]
+    if len(p.methods_stack) == 1 and isinstance(method[0], DictionaryAnalyzer):
+        _, fixed_word, para_id, idx = method
+        dictionary = get_morph_analyzer().dictionary
+        word_stem = dictionary.build_stem(dictionary.paradigms[para_id], idx, fixed_word)
+        return [prefix + word_stem + suffix for prefix, suffix in get_paradigm_affixes(para_id)]
+    return [form.word for form in p.lexeme]
+
+
+@lru_cache(maxsize=200000)
+def get_lexeme_forms(word):
+    """ All the forms of the lexemes of all the parses of a word """
+    return frozenset(form for p in parse(word) for form in get_parse_lexeme_forms(p))
+
+
 def get_possible_num_cases(word, pos_set=None):
-    return set((p.tag.number, p.tag.case) for p in pymorphy_parser.parse(word)
+    return set((p.tag.number, p.tag.case) for p in parse(word)
                if p.tag.case and p.score > 0.001 and (pos_set is None or p.tag.POS in pos_set))
 
 
 def classify(edit):
-    if not edit.o_toks and not edit.c_toks:
+    # The tokens of an edit are created on every access
+    o_toks, c_toks = edit.o_toks, edit.c_toks
+    if not o_toks and not c_toks:
         edit.type = "UNK"
-    elif not edit.o_toks and edit.c_toks:
-        edit.type = get_one_sided_type(edit.c_toks)
-    elif edit.o_toks and not edit.c_toks:
-        edit.type = get_one_sided_type(edit.o_toks)
+    elif not o_toks and c_toks:
+        edit.type = get_one_sided_type(c_toks)
+    elif o_toks and not c_toks:
+        edit.type = get_one_sided_type(o_toks)
     else:
         if edit.o_str == edit.c_str:
             edit.type = "UNK"
         else:
-            edit.type = get_two_sided_type(edit.o_toks, edit.c_toks)
+            edit.type = get_two_sided_type(o_toks, c_toks)
     return edit
 
 
+def classify_batch(edits, batch_size=32):
+    """ Classifies a list of edits. With the ML classifier, the pairs of all the edits
+    which reach it are run through the model in batches, and those edits are classified again """
+    if not ML:
+        return [classify(edit) for edit in edits]
+    from morph_ortho import MorphBatch
+    with MorphBatch() as batch:
+        pending = []
+        for edit in edits:
+            deferred = batch.deferred
+            classify(edit)
+            if batch.deferred > deferred:
+                pending.append(edit)
+        batch.run(batch_size)
+        for edit in pending:
+            classify(edit)
+    return edits
+
+
+def deferred_count():
+    """ Returns the number of ML classifications deferred in the current batch of classify_batch.
+    An edit whose classification deferred one is classified again once the batch is predicted """
+    if not ML:
+        return 0
+    import morph_ortho
+    return morph_ortho.batch.deferred if morph_ortho.batch is not None else 0
+
+
 def get_one_sided_type(toks):
     if one_sided_tense(toks):
         return "Tense"
@@ -163,103 +277,177 @@ def one_sided_prep(toks):
 
 def one_sided_lex(toks):
     # pymorphy_parser = pymorphy2.MorphAnalyzer()
-    if len(toks) == 1 and pymorphy_parser.word_is_known(toks[0].text):
+    if len(toks) == 1 and get_morph_analyzer().word_is_known(toks[0].text):
         return True
     return False
 
 
+class EditFeatures:
+    """ Data derived from the tokens of a two-sided edit. Every feature is computed
+    on first use and shared by all the predicates below """
+
+    def __init__(self, o_toks, c_toks):
+        self.o_toks = o_toks
+        self.c_toks = c_toks
+
+    @cached_property
+    def same_len(self):
+        return len(self.o_toks) == len(self.c_toks)
+
+    @cached_property
+    def single(self):
+        return len(self.o_toks) == len(self.c_toks) == 1
+
+    @cached_property
+    def o_low(self):
+        return [o.text.lower() for o in self.o_toks]
+
+    @cached_property
+    def c_low(self):
+        return [c.text.lower() for c in self.c_toks]
+
+    @cached_property
+    def o_join(self):
+        return "".join(self.o_low)
+
+    @cached_property
+    def c_join(self):
+        return "".join(self.c_low)
+
+    @cached_property
+    def lemmas_match(self):
+        """ Tokens of both sides have the same lemmas one by one """
+        return self.same_len and all(o.lemma == c.lemma for o, c in zip(self.o_toks, self.c_toks))
+
+    @cached_property
+    def o_pos_set(self):
+        return {tok.pos for tok in self.o_toks}
+
+    @cached_property
+    def c_pos_set(self):
+        return {tok.pos for tok in self.c_toks}
+
+    @cached_property
+    def o_pymorphy_pos(self):
+        return [get_pos(tok.text) for tok in self.o_toks]
+
+    @cached_property
+    def c_pymorphy_pos(self):
+        return [get_pos(tok.text) for tok in self.c_toks]
+
+    @cached_property
+    def o_numbers(self):
+        return [get_number(tok.text) for tok in self.o_toks]
+
+    @cached_property
+    def c_numbers(self):
+        return [get_number(tok.text) for tok in self.c_toks]
+
+    @cached_property
+    def o_genders(self):
+        return [get_gender(tok.text) for tok in self.o_toks]
+
+    @cached_property
+    def c_genders(self):
+        return [get_gender(tok.text) for tok in self.c_toks]
+
+    @cached_property
+    def o_num_cases(self):
+        return [get_possible_num_cases(tok.text) for tok in self.o_toks]
+
+    @cached_property
+    def c_num_cases(self):
+        return [get_possible_num_cases(tok.text) for tok in self.c_toks]
+
+
 def get_two_sided_type(o_toks, c_toks):
-    if punct(o_toks, c_toks):
+    f = EditFeatures(o_toks, c_toks)
+    if punct(f):
         return "Punct"
-    if capitalization(o_toks, c_toks):
+    if capitalization(f):
         return "Ortho"
-    if word_order(o_toks, c_toks):
+    if word_order(f):
         return "WO"
-    if graph(o_toks, c_toks):
+    if graph(f):
         return "Graph"
-    if cs(o_toks, c_toks):
+    if cs(f):
         return "CS"
-    if brev(o_toks, c_toks):
+    if brev(f):
         return "Brev"
-    if infinitive(o_toks, c_toks):
+    if infinitive(f):
         return "Infinitive"
-    if tense(o_toks, c_toks):
+    if tense(f):
         return "Tense"
-    if passive(o_toks, c_toks):
+    if passive(f):
         return "Passive"
-    if num(o_toks, c_toks):
+    if num(f):
         return "Num"
-    if gender(o_toks, c_toks):
+    if gender(f):
         return "Gender"
-    if wrong_case(o_toks, c_toks):
-        if noun_case(o_toks, c_toks):
+    if wrong_case(f):
+        if noun_case(f):
             return "Nominative" if nominative(c_toks) else "Gov"
         else:
             return "Agrcase"
-    if agrnum(o_toks, c_toks):
+    if agrnum(f):
         return "Agrnum"
-    if agrpers(o_toks, c_toks):
+    if agrpers(f):
         return "Agrpers"
-    if agrgender(o_toks, c_toks):
+    if agrgender(f):
         return "Agrgender"
 
-    if refl(o_toks, c_toks):
+    if refl(f):
         return "Refl"
-    if asp(o_toks, c_toks):
+    if asp(f):
         return "Asp"
 
-    if impers(o_toks, c_toks):
+    if impers(f):
         return "Impers"
-    if com(o_toks, c_toks):
+    if com(f):
         return "Com"
-    if mode(o_toks, c_toks):
+    if mode(f):
         return "Mode"
 
-    if hyphen_ins(o_toks, c_toks):
+    if hyphen_ins(f):
         return "Hyphen+Ins"
-    if hyphen_del(o_toks, c_toks):
+    if hyphen_del(f):
         return "Hyphen+Del"
 
-    if space_ins(o_toks, c_toks):
+    if space_ins(f):
         return "Space+Ins"
-    if space_del(o_toks, c_toks):
+    if space_del(f):
         return "Space+Del"
 
-    if conj(o_toks, c_toks):
+    if conj(f):
         return "Conj"
-    if ref(o_toks, c_toks):
+    if ref(f):
         return "Ref"
-    if prep(o_toks, c_toks):
+    if prep(f):
         return "Prep"
 
-    if infl(o_toks, c_toks):
+    if infl(f):
         return "Infl"
-    if lex(o_toks, c_toks):
+    if lex(f):
         return "Lex"
-    if constr(o_toks, c_toks):
+    if constr(f):
         return "Constr"
 
-    if typical_ortho(o_toks, c_toks):
+    if typical_ortho(f):
         return "Ortho"
-    if morph(o_toks, c_toks):
+    if morph(f):
         return "Morph"
-    if ortho(o_toks, c_toks):
+    if ortho(f):
         return "Ortho"
     return "Misspell"
 
 
-def punct(o_toks, c_toks):
-    return one_sided_punct(o_toks) and one_sided_punct(c_toks)
+def punct(f):
+    return one_sided_punct(f.o_toks) and one_sided_punct(f.c_toks)
 
 # ORTHOGRAPHY
 
-def capitalization(o_toks, c_toks):
-    if len(o_toks) != len(c_toks):
-        return False
-    for o, c in zip(o_toks, c_toks):
-        if o.text.lower() != c.text.lower():
-            return False
-    return True
+def capitalization(f):
+    return f.same_len and f.o_low == f.c_low
 
 
 def lat2cyr_replace(match):
@@ -271,41 +459,31 @@ def cyrillize(s):
     # return ''.join(latin_to_cyrillic.get(c, c) for c in s)
 
 
-def graph(o_toks, _):
-    for tok in o_toks:
+def graph(f):
+    for tok in f.o_toks:
         if (re.search(r'[\u0400-\u04FF]', tok.text) and
             re.search(r'[^\u0400-\u04FF\d\s\.,!?—:;\'\"()\[\]{}-]', cyrillize(tok.text))):
             return True
     return False
 
 
-def space_del(o_toks, c_toks):
-    o_join = "".join([o.text.lower() for o in o_toks])
-    c_join = "".join([c.text.lower() for c in c_toks])
-    if o_join == c_join and len(o_toks) < len(c_toks):
-        return True
-    return False
+def space_del(f):
+    return f.o_join == f.c_join and len(f.o_toks) < len(f.c_toks)
 
 
-def space_ins(o_toks, c_toks):
-    o_join = "".join([o.text.lower() for o in o_toks])
-    c_join = "".join([c.text.lower() for c in c_toks])
-    if o_join == c_join and len(o_toks) > len(c_toks):
-        return True
-    return False
+def space_ins(f):
+    return f.o_join == f.c_join and len(f.o_toks) > len(f.c_toks)
 
 
-def hyphen_del(o_toks, c_toks):
-    o_join = "".join([o.text.lower() for o in o_toks])
-    c_join = "".join([c.text.lower() for c in c_toks])
+def hyphen_del(f):
+    o_join, c_join = f.o_join, f.c_join
     if '-' in c_join and '-' not in o_join and lev(o_join, re.sub('-', '', c_join)) >= .75:
         return True
     return False
 
 
-def hyphen_ins(o_toks, c_toks):
-    o_join = "".join([o.text.lower() for o in o_toks])
-    c_join = "".join([c.text.lower() for c in c_toks])
+def hyphen_ins(f):
+    o_join, c_join = f.o_join, f.c_join
     if '-' in o_join and '-' not in c_join and lev(re.sub('-', '', o_join), c_join) >= .75:
         return True
     return False
@@ -313,54 +491,53 @@ def hyphen_ins(o_toks, c_toks):
 
 # MORPHOLOGY
 
-def infl(o_toks, c_toks):
-    if ((len(o_toks) == len(c_toks) == 1) and
-            ((stemmer.stem(o_toks[0].text) == stemmer.stem(c_toks[0].text)) or
-             (o_toks[0].lemma == c_toks[0].lemma))):
-        parses = pymorphy_parser.parse(c_toks[0].lemma)
-        if o_toks[0].text.lower() not in [form.word for p in parses for form in p.lexeme]:
+def infl(f):
+    o_toks, c_toks = f.o_toks, f.c_toks
+    if (f.single and
+            ((o_toks[0].lemma == c_toks[0].lemma) or
+             (stem(o_toks[0].text) == stem(c_toks[0].text)))):
+        if o_toks[0].text.lower() not in get_lexeme_forms(c_toks[0].lemma):
             return True
     return False
 
 
-def num(o_toks, c_toks):
-    if len(o_toks) != len(c_toks):
+def num(f):
+    if not f.same_len:
         return False
 
-    o_nums = [o_tok.feats.get('Number', None) for o_tok in o_toks]
-    c_nums = [c_tok.feats.get('Number', None) for c_tok in c_toks]
-    pos_set = {get_pos(tok.text) for tok in o_toks + c_toks}
-    lemmas_match_flags = [(o_toks[i].lemma == c_toks[i].lemma) for i in range(len(o_toks))]
+    o_nums = [o_tok.feats.get('Number', None) for o_tok in f.o_toks]
+    c_nums = [c_tok.feats.get('Number', None) for c_tok in f.c_toks]
 
     if ((len(set(o_nums)) == len(set(c_nums)) == 1) and
             (not (None in o_nums)) and
             (not (None in c_nums)) and
             (o_nums != c_nums) and
-            (sum(lemmas_match_flags) == len(lemmas_match_flags)) and
-            (len(pos_set & {'NOUN', 'NPRO'}) > 0)):
+            f.lemmas_match and
+            (len(set(f.o_pymorphy_pos + f.c_pymorphy_pos) & {'NOUN', 'NPRO'}) > 0)):
         return True
 
     return False
 
 
 def get_pos_gender(word, pos):
-    for p in pymorphy_parser.parse(word):
+    for p in parse(word):
         if p.tag.POS == pos:
             return p.tag.gender
     return None
 
 
-def gender(o_toks, c_toks):
-    if len(o_toks) != len(c_toks):
+def gender(f):
+    if not f.same_len:
         return False
+    o_toks, c_toks = f.o_toks, f.c_toks
 
-    if all(pymorphy_parser.word_is_known(t.text) for t in o_toks):
+    if all(get_morph_analyzer().word_is_known(t.text) for t in o_toks):
         return False
 
     pos = []
     c_gender = None
     for t in c_toks:
-        p = pymorphy_parser.parse(t.text)[0]
+        p = parse(t.text)[0]
         if (p.tag.gender is None) or (c_gender is not None and p.tag.gender != c_gender):
             return False
         c_gender = p.tag.gender
@@ -371,9 +548,7 @@ def gender(o_toks, c_toks):
         if o_gender in {None, c_gender}:
             return False
 
-    if not all([(stemmer.stem(o_toks[i].lemma) ==
-                 stemmer.stem(c_toks[i].lemma))
-                for i in range(len(o_toks))]):
+    if not all(stem(o.lemma) == stem(c.lemma) for o, c in zip(o_toks, c_toks)):
         return False
 
     gender_pos  = {'PROPN', 'NOUN', 'PRON'}
@@ -384,14 +559,14 @@ def gender(o_toks, c_toks):
     #if [o_tok.feats.get('Case', None) for o_tok in o_toks] != [c_tok.feats.get('Case', None) for c_tok in c_toks]:
     #    return False
 
-    pos_set = {tok.pos for tok in c_toks}
-    return len(pos_set & gender_pos) > 0
+    return len(f.c_pos_set & gender_pos) > 0
 
 
 # SYNTAX
 
 
-def asp(o_toks, c_toks):
+def asp(f):
+    o_toks, c_toks = f.o_toks, f.c_toks
     o_asps = set.union(*(set(get_possible_aspects(t.text)) for t in o_toks))
     c_asps = set.union(*(set(get_possible_aspects(t.text)) for t in c_toks))
     if o_asps & c_asps or len(o_asps) == 0 or len(c_asps) == 0:
@@ -409,44 +584,48 @@ def asp(o_toks, c_toks):
     return True
 
 
-def passive(o_toks, c_toks):
-    o_pos = [get_pos(o_tok.text) for o_tok in o_toks]
-    c_pos = [get_pos(c_tok.text) for c_tok in c_toks]
-    if not ({'VERB', 'PRTS'} & set(o_pos) and {'VERB', 'PRTS'} & set(c_pos)):
+def passive(f):
+    o_toks = f.o_toks
+    if not ({'VERB', 'PRTS'} & set(f.o_pymorphy_pos) and {'VERB', 'PRTS'} & set(f.c_pymorphy_pos)):
         return False
 
     o_voices = [o_tok.feats.get('Voice', None) for o_tok in o_toks]
-    c_voices = [c_tok.feats.get('Voice', None) for c_tok in c_toks]
+    c_voices = [c_tok.feats.get('Voice', None) for c_tok in f.c_toks]
     if 'Pass' not in o_voices and 'Pass' in c_voices:
         return True
 
     return ('Pass' in o_voices and
             'Pass' not in c_voices
-            and pymorphy_parser.word_is_known(o_toks[o_voices.index('Pass')].text))
+            and get_morph_analyzer().word_is_known(o_toks[o_voices.index('Pass')].text))
 
 
-def brev_natasha(o_toks, c_toks):
-    for o_tok in o_toks:
-        for c_tok in c_toks:
+def brev_natasha(f):
+    for o_tok in f.o_toks:
+        for c_tok in f.c_toks:
             if ((o_tok.lemma == c_tok.lemma
-                 or stemmer.stem(o_tok.text) == stemmer.stem(c_tok.text))
+                 or stem(o_tok.text) == stem(c_tok.text))
                     and o_tok.feats.get('Variant') != c_tok.feats.get('Variant')):
                 return True
     return False
 
 
+@lru_cache(maxsize=200000)
+def get_adjective_parses(word):
+    return tuple(p for p in parse(word) if p.tag.POS in ['ADJF', 'ADJS', 'PRTS', 'PRTF'])
+
+
 def get_adjectives(toks):
-    return [p for t in toks for p in pymorphy_parser.parse(t.text) if p.tag.POS in ['ADJF', 'ADJS', 'PRTS', 'PRTF']]
+    return [p for t in toks for p in get_adjective_parses(t.text)]
 
 
-def brev(o_toks, c_toks):
-    o_adjs = get_adjectives(o_toks)
-    c_adjs = get_adjectives(c_toks)
+def brev(f):
+    o_adjs = get_adjectives(f.o_toks)
+    c_adjs = get_adjectives(f.c_toks)
     for o in o_adjs:
         for c in c_adjs:
             if (o.tag.POS != c.tag.POS and
                     (o.normal_form == c.normal_form or
-                     stemmer.stem(o.word) == stemmer.stem(c.word))):
+                     stem(o.word) == stem(c.word))):
                 return True
     return False
 
@@ -463,9 +642,10 @@ def extract_aux_tense_asp(toks):
     return False, extracted_tense, extracted_asp
 
 
-def tense(o_toks, c_toks):
+def tense(f):
+    o_toks, c_toks = f.o_toks, f.c_toks
     # Past <-> Present switch
-    if len(o_toks) == len(c_toks) == 1:
+    if f.single:
         o_tok = o_toks[0]
         c_tok = c_toks[0]
         if (o_tok.pos == c_tok.pos == 'VERB' and
@@ -482,8 +662,9 @@ def tense(o_toks, c_toks):
         return aux_in_o != aux_in_c and o_tense != c_tense
     return False
 
-def infinitive(o_toks, c_toks):
-    return (len(o_toks) == len(c_toks) == 1 and
+def infinitive(f):
+    o_toks, c_toks = f.o_toks, f.c_toks
+    return (f.single and
             o_toks[0].pos == c_toks[0].pos == 'VERB' and
             'VerbForm' in o_toks[0].feats and
             'VerbForm' in c_toks[0].feats and
@@ -507,8 +688,16 @@ def remove_refl_postfix(text):
 
 
 def related_stems(first, second):
-    first_stem = stemmer.stem(first)
-    second_stem = stemmer.stem(second)
+    # The relation is symmetric, so both orders of a pair share a cache entry
+    if second < first:
+        first, second = second, first
+    return ordered_related_stems(first, second)
+
+
+@lru_cache(maxsize=200000)
+def ordered_related_stems(first, second):
+    first_stem = stem(first)
+    second_stem = stem(second)
     min_length = min(len(first_stem), len(second_stem))
 
     common_prefix = 0
@@ -523,24 +712,28 @@ def related_stems(first, second):
             second_stem in first_stem)
 
 
-def morph(o_toks, c_toks):
+def morph(f):
     if ML:
-        return morph_ml(o_toks, c_toks)
-    return (len(o_toks) == len(c_toks) == 1
+        return morph_ml(f)
+    o_toks, c_toks = f.o_toks, f.c_toks
+    return (f.single
             and Levenshtein.distance(o_toks[0].text, c_toks[0].text) > 1
             and o_toks[0].lemma != c_toks[0].lemma
             and related_stems(o_toks[0].lemma, c_toks[0].lemma))
 
 
-def morph_ml(o_toks, c_toks):
-    return (ML and
-            len(o_toks) == len(c_toks) == 1
-            and is_morph(o_toks[0].text, c_toks[0].text))
+def morph_ml(f):
+    if not ML:
+        return False
+    # The model is only imported when the ML classifier is enabled
+    from morph_ortho import is_morph
+    return (f.single
+            and is_morph(f.o_toks[0].text, f.c_toks[0].text))
 
 
-def refl(o_toks, c_toks):
-    o_verbs = [t for t in o_toks if get_pos(t.text) == 'VERB']
-    c_verbs = [t for t in c_toks if get_pos(t.text) == 'VERB']
+def refl(f):
+    o_verbs = [t for t, pos in zip(f.o_toks, f.o_pymorphy_pos) if pos == 'VERB']
+    c_verbs = [t for t, pos in zip(f.c_toks, f.c_pymorphy_pos) if pos == 'VERB']
     if len(o_verbs) == len(c_verbs) == 1:
         o_basic = remove_refl_postfix(o_verbs[0].lemma)
         c_basic = remove_refl_postfix(c_verbs[0].lemma)
@@ -553,33 +746,32 @@ def refl(o_toks, c_toks):
     return False
 
 
-def agrnum(o_toks, c_toks):
-    if len(o_toks) != len(c_toks):
+def agrnum(f):
+    if not f.same_len:
         return False
 
-    o_nums = [get_number(o_tok.text) for o_tok in o_toks]
-    c_nums = [get_number(c_tok.text) for c_tok in c_toks]
-    lemmas_match_flags = [(o_toks[i].lemma == c_toks[i].lemma) for i in range(len(o_toks))]
+    o_nums = f.o_numbers
+    c_nums = f.c_numbers
 
     if ((len(set(o_nums)) == len(set(c_nums)) == 1) and
             (not (None in o_nums)) and
             (not (None in c_nums)) and
             (o_nums != c_nums) and
-            (sum(lemmas_match_flags) == len(lemmas_match_flags))):
+            f.lemmas_match):
         return True
 
     return False
 
 
-def wrong_case(o_toks, c_toks):
-    if len(o_toks) != len(c_toks):
+def wrong_case(f):
+    if not f.same_len:
         return False
 
-    o_num_cases = set.intersection(*[get_possible_num_cases(t.text) for t in o_toks])
+    o_num_cases = set.intersection(*f.o_num_cases)
     if not o_num_cases:
         return False
 
-    c_num_cases = set.intersection(*[get_possible_num_cases(t.text) for t in c_toks])
+    c_num_cases = set.intersection(*f.c_num_cases)
     if not c_num_cases:
         return False
 
@@ -590,15 +782,11 @@ def wrong_case(o_toks, c_toks):
         # different numbers
         return False
 
-    for o, c in zip(o_toks, c_toks):
-        if o.lemma != c.lemma:
-            return False
-
-    return True
+    return f.lemmas_match
 
 
-def noun_case(o_toks, c_toks):
-    pos_set = {tok.pos for tok in o_toks + c_toks}
+def noun_case(f):
+    pos_set = f.o_pos_set | f.c_pos_set
     return len(pos_set & {'PROPN', 'NOUN', 'PRON'}) > 0
 
 
@@ -607,46 +795,44 @@ def nominative(c_toks):
     return 'Nom' in c_cases
 
 
-def agrgender(o_toks, c_toks):
-    if len(o_toks) != len(c_toks):
+def agrgender(f):
+    if not f.same_len:
         return False
 
     # o_genders = [o_tok.feats.get('Gender', None) for o_tok in o_toks]
     # c_genders = [c_tok.feats.get('Gender', None) for c_tok in c_toks]
-    o_genders = [get_gender(o_tok.text) for o_tok in o_toks]
-    c_genders = [get_gender(o_tok.text) for o_tok in c_toks]
-    lemmas_match_flags = [(o_toks[i].lemma == c_toks[i].lemma) for i in range(len(o_toks))]
+    o_genders = f.o_genders
+    c_genders = f.c_genders
 
     if ((len(set(o_genders)) == len(set(c_genders)) == 1) and
             (not (None in o_genders)) and
             (not (None in c_genders)) and
             (o_genders != c_genders) and
-            (sum(lemmas_match_flags) == len(lemmas_match_flags))):
+            f.lemmas_match):
         return True
     return False
 
 
-def agrpers(o_toks, c_toks):
-    if len(o_toks) != len(c_toks):
+def agrpers(f):
+    if not f.same_len:
         return False
 
-    o_pers = [o_tok.feats.get('Person', None) for o_tok in o_toks]
-    c_pers = [c_tok.feats.get('Person', None) for c_tok in c_toks]
-    lemmas_match_flags = [(o_toks[i].lemma == c_toks[i].lemma) for i in range(len(o_toks))]
+    o_pers = [o_tok.feats.get('Person', None) for o_tok in f.o_toks]
+    c_pers = [c_tok.feats.get('Person', None) for c_tok in f.c_toks]
 
     if ((len(set(o_pers)) == len(set(c_pers)) == 1) and
             (not (None in o_pers)) and
             (not (None in c_pers)) and
             (set(o_pers) != set(c_pers)) and
-            (sum(lemmas_match_flags) == len(lemmas_match_flags))):
+            f.lemmas_match):
         return True
 
     return False
 
 
-def mode(o_toks, c_toks):
-    aux_in_o_toks = [(tok.pos == 'AUX' and tok.feats.get('Mood') == 'Cnd') for tok in o_toks]
-    aux_in_c_toks = [(tok.pos == 'AUX' and tok.feats.get('Mood') == 'Cnd') for tok in c_toks]
+def mode(f):
+    aux_in_o_toks = [(tok.pos == 'AUX' and tok.feats.get('Mood') == 'Cnd') for tok in f.o_toks]
+    aux_in_c_toks = [(tok.pos == 'AUX' and tok.feats.get('Mood') == 'Cnd') for tok in f.c_toks]
 
     if ((any(aux_in_o_toks) and not any(aux_in_c_toks)) or
             (any(aux_in_c_toks) and not any(aux_in_o_toks))):
@@ -658,13 +844,13 @@ def is_pronoun(tok):
     return tok.pos in {'DET', 'PRON'}
 
 
-def ref(o_toks, c_toks):
-    return (all(is_pronoun(t) for t in o_toks) or
-            all(is_pronoun(t) for t in c_toks))
+def ref(f):
+    return (all(is_pronoun(t) for t in f.o_toks) or
+            all(is_pronoun(t) for t in f.c_toks))
 
 
 def is_introductory_word(text):
-    return 'Prnt' in pymorphy_parser.parse(text)[0].tag
+    return 'Prnt' in parse(text)[0].tag
 
 
 def is_conj(tok):
@@ -672,13 +858,13 @@ def is_conj(tok):
                                              not is_introductory_word(tok.text))
 
 
-def conj(o_toks, c_toks):
-    return any(is_conj(t) for t in o_toks + c_toks)
+def conj(f):
+    return any(is_conj(t) for t in f.o_toks + f.c_toks)
 
 
-def com(o_toks, c_toks):
-    o_cmp_flags = [True if tok.feats.get('Degree') == 'Cmp' else False for tok in o_toks]
-    c_cmp_flags = [True if tok.feats.get('Degree') == 'Cmp' else False for tok in c_toks]
+def com(f):
+    o_cmp_flags = [True if tok.feats.get('Degree') == 'Cmp' else False for tok in f.o_toks]
+    c_cmp_flags = [True if tok.feats.get('Degree') == 'Cmp' else False for tok in f.c_toks]
     if any(o_cmp_flags + c_cmp_flags):
         return True
     else:
@@ -689,7 +875,8 @@ def count_words(toks):
     return len([t for t in toks if t.pos != 'PUNCT'])
 
 
-def impers(o_toks, c_toks):
+def impers(f):
+    o_toks, c_toks = f.o_toks, f.c_toks
     o_rel = {tok.rel for tok in o_toks}
     c_rel = {tok.rel for tok in c_toks}
     return ((('nsubj' in o_rel and 'nsubj' not in c_rel) or
@@ -697,20 +884,20 @@ def impers(o_toks, c_toks):
             count_words(o_toks) > 1 and count_words(c_toks) > 1)
 
 
-def cs(o_toks, c_toks):
-    for tok in o_toks:
+def cs(f):
+    for tok in f.o_toks:
         if tok.feats.get('Foreign') == 'Yes':
             return True
     return False
 
 
-def lex(o_toks, c_toks):
-    if len(o_toks) != 1 or len(c_toks) != 1:
+def lex(f):
+    if not f.single:
         return False
 
-    o = o_toks[0].text
-    c = c_toks[0].text
-    if not pymorphy_parser.word_is_known(o) or get_normal_form(o) == get_normal_form(c):
+    o = f.o_toks[0].text
+    c = f.c_toks[0].text
+    if not get_morph_analyzer().word_is_known(o) or get_normal_form(o) == get_normal_form(c):
         return False
 
     # double letters and letters in a wrong order are ortho
@@ -718,21 +905,21 @@ def lex(o_toks, c_toks):
     return set(o) != set(c) and distance(o, c) > 1
 
 
-def prep(o_toks, c_toks):
-    return o_toks[0].pos == 'ADP' == c_toks[0].pos and o_toks[0].text.lower() != c_toks[0].text.lower()
+def prep(f):
+    o_toks, c_toks = f.o_toks, f.c_toks
+    return o_toks[0].pos == 'ADP' == c_toks[0].pos and f.o_low[0] != f.c_low[0]
 
 
-def ortho(o_toks, c_toks):
-    if ((len(o_toks) == len(c_toks) == 1) and
-            (lev(o_toks[0].text, c_toks[0].text) >= 0.8)):
+def ortho(f):
+    if f.single and (lev(f.o_toks[0].text, f.c_toks[0].text) >= 0.8):
         return True
     return False
 
 
-def typical_ortho(o_toks, c_toks):
-    if len(o_toks) == len(c_toks) > 1:
+def typical_ortho(f):
+    if len(f.o_toks) == len(f.c_toks) > 1:
         return False
-    ot, ct = o_toks[0].text, c_toks[0].text
+    ot, ct = f.o_toks[0].text, f.c_toks[0].text
     if len(ot) != len(ct):
         return False
     for o, c in zip(ot, ct):
@@ -741,7 +928,8 @@ def typical_ortho(o_toks, c_toks):
     return True
 
 
-def aux(o_toks, c_toks):
+def aux(f):
+    o_toks, c_toks = f.o_toks, f.c_toks
     o_aux_flags = [(tok.lemma == 'быть' or tok.lemma == 'стать') for tok in o_toks]
     c_aux_flags = [(tok.lemma == 'быть' or tok.lemma == 'стать') for tok in c_toks]
     if ((len(o_toks) > 1) and
@@ -751,15 +939,15 @@ def aux(o_toks, c_toks):
     return False
 
 
-def constr(o_toks, c_toks):
-    if len(o_toks) > 1 or len(c_toks) > 1:
+def constr(f):
+    if len(f.o_toks) > 1 or len(f.c_toks) > 1:
         return True
     return False
 
 
-def word_order(o_toks, c_toks):
-    o_set = sorted([o.text.lower() for o in o_toks])
-    c_set = sorted([c.text.lower() for c in c_toks])
+def word_order(f):
+    o_set = sorted(f.o_low)
+    c_set = sorted(f.c_low)
     if o_set == c_set and len(o_set) > 1:
         return True
     return False
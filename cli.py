@@ -0,0 +1,179 @@
+""" Command-line interface: annotates corpus files pair by pair and writes M2 or JSONL """
+
+import argparse
+import contextlib
+import json
+import sys
+from collections import deque
+from itertools import islice, zip_longest
+
+import resources
+from annotator import Annotator
+from rule_profiler import RuleProfiler
+from text_processor import CyrLatSegmenter
+
+
+def read_tsv(lines):
+    """ Yields (original, corrected) pairs from lines of the form orig<TAB>cor.
+    Lines without a tab are skipped with a warning """
+    for number, line in enumerate(lines, 1):
+        line = line.rstrip("\n")
+        if not line:
+            continue
+        if "\t" not in line:
+            print("Skipping line %d: no tab between the original and the correction" % number,
+                  file=sys.stderr)
+            continue
+        orig, cor = line.split("\t")[:2]
+        yield orig, cor
+
+
+def read_parallel(orig_lines, cor_lines):
+    """ Yields pairs from two line-aligned files, raises ValueError if one of them is shorter """
+    for number, (orig, cor) in enumerate(zip_longest(orig_lines, cor_lines), 1):
+        if orig is None or cor is None:
+            shorter, longer = ("original", "corrected") if orig is None else ("corrected", "original")
+            raise ValueError("The %s file has fewer lines than the %s file, it ends before line %d"
+                             % (shorter, longer, number))
+        yield orig.rstrip("\n"), cor.rstrip("\n")
+
+
+def apply_m2_edits(orig, edits):
+    """ Builds a corrected sentence from the original tokens and M2 edits """
+    cor = orig[:]
+    offset = 0
+    for start, end, c_str in edits:
+        c_toks = c_str.split() if c_str != "-NONE-" else []
+        cor[start + offset:end + offset] = c_toks
+        offset += len(c_toks) - (end - start)
+    return cor
+
+
+def read_m2(lines, annotator_id=0):
+    """ Yields pairs from M2 blocks, the correction is built from the edits of a given annotator """
+    orig = None
+    edits = []
+    for line in lines:
+        line = line.rstrip("\n")
+        if line.startswith("S "):
+            orig = line[2:].split(" ")
+            edits = []
+        elif line.startswith("A ") and orig is not None:
+            span, err_type, c_str, *rest = line[2:].split("|||")
+            if err_type in {"noop", "UNK", "Um"} or int(rest[-1]) != annotator_id:
+                continue
+            start, end = map(int, span.split())
+            edits.append((start, end, c_str))
+        elif not line and orig is not None:
+            yield " ".join(orig), " ".join(apply_m2_edits(orig, edits))
+            orig = None
+    if orig is not None:
+        yield " ".join(orig), " ".join(apply_m2_edits(orig, edits))
+
+
+def write_m2(out, tokens, edits):
+    out.write("S " + " ".join(tokens) + "\n")
+    if not edits:
+        out.write("A -1 -1|||noop|||-NONE-|||REQUIRED|||-NONE-|||0\n")
+    for edit in edits:
+        out.write("A %d %d|||%s|||%s|||REQUIRED|||-NONE-|||0\n" %
+                  (edit.o_start, edit.o_end, edit.type, edit.c_str))
+    out.write("\n")
+
+
+def write_jsonl(out, orig, cor, edits):
+    record = {"orig": orig, "cor": cor, "edits": [edit.to_dict() for edit in edits]}
+    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def annotate_stream(pairs, batch_size=64, merging="rules", processes=1, chunksize=64,
+                    cache_size=0, store=None):
+    """ Yields (original, corrected, edits) triples, keeping only a few batches of pairs in memory """
+    if processes != 1:
+        from parallel import annotate_parallel
+        pending = deque()
+
+        def remember(pairs):
+            for pair in pairs:
+                pending.append(pair)
+                yield pair
+
+        for edits in annotate_parallel(remember(pairs), processes, chunksize, batch_size, merging,
+                                       cache_size=cache_size, store=store):
+            orig, cor = pending.popleft()
+            yield orig, cor, edits
+        return
+
+    annotator = Annotator(cache_size, store=store)
+    pairs = iter(pairs)
+    while True:
+        batch = list(islice(pairs, batch_size))
+        if not batch:
+            return
+        results = annotator.annotate_batch(batch, batch_size, merging)
+        for (orig, cor), edits in zip(batch, results):
+            yield orig, cor, edits
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extracts and classifies edits between original "
+                                                 "and corrected Russian sentences.")
+    parser.add_argument("input", help="Input file: orig<TAB>cor lines, original sentences "
+                                      "(with --cor) or M2; - for stdin")
+    parser.add_argument("--cor", help="File with corrected sentences, line-aligned with the input")
+    parser.add_argument("--input-format", choices=["tsv", "parallel", "m2"], default="tsv")
+    parser.add_argument("--output-format", choices=["m2", "jsonl"], default="m2")
+    parser.add_argument("-o", "--output", default="-", help="Output file; - for stdout")
+    parser.add_argument("--merging", choices=["rules", "all-split", "all-merge", "all-equal"],
+                        default="rules")
+    parser.add_argument("--annotator-id", type=int, default=0,
+                        help="Annotator whose edits form the correction of M2 input")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--chunksize", type=int, default=64)
+    parser.add_argument("--cache-size", type=int, default=0,
+                        help="Number of processed texts kept in memory to skip repeated sentences")
+    parser.add_argument("--store", help="SQLite file of processed texts reused across runs")
+    parser.add_argument("--profile-rules", metavar="JSON",
+                        help="Save statistics of the classification rules to a JSON file and print "
+                             "them to stderr; rules run in worker processes are not counted")
+    parser.add_argument("--timings", action="store_true",
+                        help="Print the loading times of the models to stderr")
+    args = parser.parse_args(argv)
+
+    if args.input_format == "parallel" and not args.cor:
+        parser.error("--cor is required for parallel input")
+
+    with contextlib.ExitStack() as files:
+        # Only the files opened here are closed, not stdin and stdout
+        inp = sys.stdin if args.input == "-" else files.enter_context(open(args.input, encoding="utf-8"))
+        out = sys.stdout if args.output == "-" else files.enter_context(
+            open(args.output, "w", encoding="utf-8"))
+        if args.input_format == "tsv":
+            pairs = read_tsv(inp)
+        elif args.input_format == "m2":
+            pairs = read_m2(inp, args.annotator_id)
+        else:
+            pairs = read_parallel(inp, files.enter_context(open(args.cor, encoding="utf-8")))
+
+        if args.profile_rules:
+            profiler = RuleProfiler().enable()
+        segmenter = CyrLatSegmenter()
+        for orig, cor, edits in annotate_stream(pairs, args.batch_size, args.merging,
+                                                args.processes, args.chunksize, args.cache_size,
+                                                args.store):
+            if args.output_format == "m2":
+                write_m2(out, [token.text for token in segmenter.tokenize(orig)], edits)
+            else:
+                write_jsonl(out, orig, cor, edits)
+        out.flush()
+    if args.profile_rules:
+        profiler.disable()
+        profiler.save(args.profile_rules)
+        print(profiler.report(), file=sys.stderr)
+    if args.timings:
+        print(resources.startup_report(), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+""" Content-addressed on-disk store of processed documents. Re-annotating a corpus loads
+the tokens of unchanged texts from the store instead of running the natasha models again """
+
+import hashlib
+import json
+import os
+import sqlite3
+import zlib
+from importlib.metadata import version, PackageNotFoundError
+
+from natasha.doc import Doc, DocSent, DocToken
+
+# Bump when TextProcessor starts producing different tokens for the same versions of the libraries
+store_format = 1
+
+# Libraries, with their bundled models and dictionaries, that the tokens depend on
+packages = ["natasha", "slovnet", "navec", "razdel", "pymorphy2", "pymorphy2-dicts-ru"]
+
+
+def models_version():
+    """ Identifies the segmentation, the models and the dictionaries documents are processed with """
+    versions = ["format=%s" % store_format]
+    for package in packages:
+        try:
+            versions.append("%s=%s" % (package, version(package)))
+        except PackageNotFoundError:
+            versions.append("%s=none" % package)
+    return ";".join(versions)
+
+
+def dump_doc(doc):
+    """ Sentences with the tokens as lists of their attributes """
+    return [[sent.start, sent.stop, sent.text,
+             [[token.start, token.stop, token.text, token.id, token.head_id, token.rel,
+               token.pos, token.feats, token.lemma] for token in sent.tokens]]
+            for sent in doc.sents or []]
+
+
+def load_doc(text, sents):
+    """ Rebuilds a natasha Doc from the output of dump_doc """
+    doc = Doc(text)
+    doc.sents = []
+    doc.tokens = []
+    for start, stop, sent_text, tokens in sents:
+        tokens = [DocToken(*token) for token in tokens]
+        doc.sents.append(DocSent(start, stop, sent_text, tokens))
+        doc.tokens += tokens
+    return doc
+
+
+class DocStore:
+    """ Processed documents in SQLite keyed by the hash of the text and the versions
+    of the models, so that documents processed by other models are never returned """
+
+    def __init__(self, path):
+        self.path = path
+        self.version = models_version()
+        self.db = None
+        self.pid = None
+        self.stats = {"hits": 0, "misses": 0, "writes": 0}
+
+    def connect(self):
+        # A connection can not be shared with forked worker processes
+        if self.pid != os.getpid():
+            self.db = sqlite3.connect(self.path, timeout=60)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS docs (key TEXT PRIMARY KEY, data BLOB)")
+            self.pid = os.getpid()
+        return self.db
+
+    def key(self, text):
+        return hashlib.sha256((self.version + "\n" + text).encode()).hexdigest()
+
+    def get_many(self, texts):
+        """ Returns the stored docs of the given texts by text """
+        db = self.connect()
+        docs = {}
+        for text in texts:
+            row = db.execute("SELECT data FROM docs WHERE key = ?", (self.key(text),)).fetchone()
+            if row is not None:
+                docs[text] = load_doc(text, json.loads(zlib.decompress(row[0])))
+        self.stats["hits"] += len(docs)
+        self.stats["misses"] += len(texts) - len(docs)
+        return docs
+
+    def put_many(self, docs):
+        """ Stores processed docs given by text """
+        db = self.connect()
+        with db:
+            db.executemany("INSERT OR REPLACE INTO docs VALUES (?, ?)",
+                           [(self.key(text), zlib.compress(json.dumps(dump_doc(doc), ensure_ascii=False)
+                                                           .encode()))
+                            for text, doc in docs.items()])
+        self.stats["writes"] += len(docs)
+
+    def store_info(self):
+        """ Returns hit, miss and write counts of the store """
+        return dict(self.stats, path=self.path, version=self.version)
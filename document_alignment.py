@@ -0,0 +1,127 @@
+""" Alignment of document-length texts. Tokens that surely match (identical sentences and
+token n-grams occurring once in each text) are taken as anchors, which split the texts into
+independent chunks, and the dynamic programming of Alignment only runs inside the chunks """
+
+from bisect import bisect_left
+
+from alignment import Alignment
+
+
+class Tokens:
+    """ A part of a document, aligned by Alignment like a processed document """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+
+
+def align_chunk(o_tokens, c_tokens, engine):
+    return Alignment(Tokens(o_tokens), Tokens(c_tokens), engine).align_seq
+
+
+def unique_ngrams(texts, n):
+    """ Returns the start of every n-gram of the texts occurring only once, by n-gram """
+    starts = {}
+    for start in range(len(texts) - n + 1):
+        ngram = tuple(texts[start:start + n])
+        starts[ngram] = None if ngram in starts else start
+    return {ngram: start for ngram, start in starts.items() if start is not None}
+
+
+def sentence_spans(doc):
+    """ Returns the start of every sentence occurring only once, by the texts of its tokens """
+    spans = {}
+    start = 0
+    for sent in getattr(doc, "sents", None) or []:
+        key = tuple(token.text for token in sent.tokens)
+        spans[key] = None if key in spans else start
+        start += len(sent.tokens)
+    return {key: start for key, start in spans.items() if start is not None and key}
+
+
+def longest_increasing(pairs):
+    """ The longest subsequence of (i, j) pairs sorted by i in which j increases too """
+    tails = []
+    tail_ids = []
+    previous = []
+    for n, (i, j) in enumerate(pairs):
+        k = bisect_left(tails, j)
+        if k == len(tails):
+            tails.append(j)
+            tail_ids.append(n)
+        else:
+            tails[k] = j
+            tail_ids[k] = n
+        previous.append(tail_ids[k - 1] if k else None)
+    result = []
+    n = tail_ids[-1] if tail_ids else None
+    while n is not None:
+        result.append(pairs[n])
+        n = previous[n]
+    return result[::-1]
+
+
+class DocumentAlignment(Alignment):
+    """ Alignment of long texts split at anchors. The alignment inside every chunk is that of
+    Alignment, and align_seq covers the whole texts, so the merging algorithms work on it unchanged.
+    Anchors are sentences and n-grams of n tokens occurring once in each text; texts shorter than
+    min_tokens are aligned as a whole. With an executor (e.g. concurrent.futures.ProcessPoolExecutor),
+    the chunks are aligned in parallel """
+
+    def __init__(self, orig, cor, engine="python", n=3, min_tokens=200, executor=None):
+        self.orig = orig.tokens
+        self.cor = cor.tokens
+        self.engine = engine
+        if len(self.orig) + len(self.cor) < min_tokens:
+            self.matches = []
+        else:
+            self.matches = self.get_anchor_matches(orig, cor, n)
+        self.chunks = self.get_chunks()
+        jobs = [(self.orig[o_start:o_end], self.cor[c_start:c_end], engine)
+                for o_start, o_end, c_start, c_end in self.chunks]
+        if executor is not None:
+            seqs = list(executor.map(align_chunk, *zip(*jobs))) if jobs else []
+        else:
+            seqs = [align_chunk(*job) for job in jobs]
+
+        chunk_seqs = {chunk[:3:2]: seq for chunk, seq in zip(self.chunks, seqs)}
+        self.align_seq = []
+        o_pos = c_pos = 0
+        for i, j in self.matches + [(len(self.orig), len(self.cor))]:
+            if (o_pos, c_pos) != (i, j):
+                self.align_seq += [(op, o_start + o_pos, o_end + o_pos, c_start + c_pos, c_end + c_pos)
+                                   for op, o_start, o_end, c_start, c_end in chunk_seqs[o_pos, c_pos]]
+            if i < len(self.orig):
+                self.align_seq.append(("M", i, i + 1, j, j + 1))
+            o_pos, c_pos = i + 1, j + 1
+
+    def get_anchor_matches(self, orig, cor, n):
+        """ Returns the (original, corrected) indices of the anchor tokens in increasing order """
+        candidates = set()
+        o_sents = sentence_spans(orig)
+        for key, c_start in sentence_spans(cor).items():
+            if key in o_sents:
+                candidates.update((o_sents[key] + k, c_start + k) for k in range(len(key)))
+        o_ngrams = unique_ngrams([token.text for token in self.orig], n)
+        for ngram, c_start in unique_ngrams([token.text for token in self.cor], n).items():
+            if ngram in o_ngrams:
+                candidates.update((o_ngrams[ngram] + k, c_start + k) for k in range(n))
+        # Anchors crossing each other are dropped. Sorting the matches of a token by decreasing j
+        # keeps at most one of them in an increasing sequence
+        return longest_increasing(sorted(candidates, key=lambda x: (x[0], -x[1])))
+
+    def get_chunks(self):
+        """ Returns the spans between the anchors as (o_start, o_end, c_start, c_end) """
+        chunks = []
+        o_pos = c_pos = 0
+        for i, j in self.matches + [(len(self.orig), len(self.cor))]:
+            if (o_pos, c_pos) != (i, j):
+                chunks.append((o_pos, i, c_pos, j))
+            o_pos, c_pos = i + 1, j + 1
+        return chunks
+
+    def __str__(self):
+        orig = " ".join(["Orig:"] + [tok.text for tok in self.orig])
+        cor = " ".join(["Cor:"] + [tok.text for tok in self.cor])
+        chunks = "Chunks: " + str(self.chunks)
+        seq = "Best alignment: " + str([a[0] for a in self.align_seq])
+        return "\n".join([orig, cor, chunks, seq])
@@ -1,35 +1,55 @@
+from token_store import TokenStore
+
+
 class Edit:
-    """ Main class for a single edit object """
+    """ Main class for a single edit object. Only the spans are stored, the tokens are read
+    from the token stores of the documents, which are shared by all their edits """
+    __slots__ = ("o_start", "o_end", "c_start", "c_end", "type", "orig", "cor")
 
     def __init__(self, orig, cor, edit, err_type="NA"):
+        # orig and cor are token stores or lists of tokens
+        self.orig = orig if isinstance(orig, TokenStore) else TokenStore(orig)
+        self.cor = cor if isinstance(cor, TokenStore) else TokenStore(cor)
         self.o_start = edit[0]
         self.o_end = edit[1]
-        self.o_toks = orig[self.o_start:self.o_end]
-        self.o_str = ' '.join(map(lambda x: x.text, self.o_toks)) if self.o_toks else ''
         self.c_start = edit[2]
         self.c_end = edit[3]
-        self.c_toks = cor[self.c_start:self.c_end]
-        self.c_str = ' '.join(map(lambda x: x.text, self.c_toks)) if self.c_toks else ''
         self.type = err_type
 
+    @property
+    def o_toks(self):
+        return self.orig.tokens(self.o_start, self.o_end)
+
+    @property
+    def c_toks(self):
+        return self.cor.tokens(self.c_start, self.c_end)
+
+    @property
+    def o_str(self):
+        return ' '.join(self.orig.texts(self.o_start, self.o_end))
+
+    @property
+    def c_str(self):
+        return ' '.join(self.cor.texts(self.c_start, self.c_end))
+
     def minimise(self):
         """ Removes matching tokens from the edit """
-        while self.o_toks and self.c_toks and \
-                self.o_toks[0].text == self.c_toks[0].text:
-            self.o_toks = self.o_toks[1:]
-            self.c_toks = self.c_toks[1:]
+        while self.o_start < self.o_end and self.c_start < self.c_end and \
+                self.orig.text(self.o_start) == self.cor.text(self.c_start):
             self.o_start += 1
             self.c_start += 1
-        while self.o_toks and self.c_toks and \
-                self.o_toks[-1].text == self.c_toks[-1].text:
-            self.o_toks = self.o_toks[:-1]
-            self.c_toks = self.c_toks[:-1]
+        while self.o_start < self.o_end and self.c_start < self.c_end and \
+                self.orig.text(self.o_end - 1) == self.cor.text(self.c_end - 1):
             self.o_end -= 1
             self.c_end -= 1
-        self.o_str = self.o_toks.text if self.o_toks else ""
-        self.c_str = self.c_toks.text if self.c_toks else ""
         return self
 
+    def to_dict(self):
+        """ Returns the edit as a JSON-serialisable dictionary """
+        return {"o_start": self.o_start, "o_end": self.o_end, "o_str": self.o_str,
+                "c_start": self.c_start, "c_end": self.c_end, "c_str": self.c_str,
+                "type": self.type}
+
     def __str__(self):
         orig = "Orig: "+str([self.o_start, self.o_end, self.o_str])
         cor = "Cor: "+str([self.c_start, self.c_end, self.c_str])
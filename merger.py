@@ -1,7 +1,8 @@
 """ Module implementing merging rules. """
 
 from edit import Edit
-from itertools import combinations, groupby
+from functools import cached_property
+from itertools import groupby
 from re import sub
 import Levenshtein
 from string import punctuation
@@ -12,25 +13,20 @@ open_pos = {'ADJ', 'AUX', 'ADV', 'NOUN'}#, 'VERB'}
 def get_rule_edits(alignment):
     """ Merges edits based on a set of rules """
     edits = []
+    merger = RuleMerger(alignment)
     for op, group in groupby(alignment.align_seq,
                              lambda x: "T" if x[0][0] == "T" else False):
         group = list(group)
         if op == "T":
             for seq in group:
-                edits.append(Edit(alignment.orig, alignment.cor, seq[1:]))
+                edits.append(Edit(alignment.o_store, alignment.c_store, seq[1:]))
         else:
-            processed = process_seq(group, alignment)
+            processed = merger.merge(group)
             for seq in processed:
-                edits.append(Edit(alignment.orig, alignment.cor, seq[1:]))
+                edits.append(Edit(alignment.o_store, alignment.c_store, seq[1:]))
     return edits
 
 
-def merge_by_indices(start, end, seq, alignment):
-    return (process_seq(seq[:start], alignment) +
-            merge_edits(seq[start : end + 1]) +
-            process_seq(seq[end + 1:], alignment))
-
-
 def number_case(seq):
     """If all elements have the same number and case,
     returns (number, case), otherwise None."""
@@ -46,114 +42,306 @@ def number_case(seq):
 
 def process_seq(seq, alignment):
     """ Processes a given sequence for merging based on rules"""
-    ops = [op[0] for op in seq]
+    return RuleMerger(alignment).merge(seq)
 
-    # delete leading and trailing matches
-    matches = ''.join(['M' if op == 'M' else 'N' for op in ops])
-    left, right = matches.find('N'), matches.rfind('N') + 1
-    seq = seq[left:right]
-    if len(seq) <= 1:
-        return seq
 
-    ops = ops[left:right]
-    unique_ops = set(ops)
-    if unique_ops == {"D"} or unique_ops == {"I"}:
-        return merge_edits(seq)
-
-    # Loop through combinations of adjacent tokens, starting with the largest
-    combos = list(combinations(range(0, len(seq)), 2))
-    combos.sort(key=lambda x: x[1] - x[0], reverse=True)
-
-    for start, end in combos:
-        subops = ops[start: end + 1]
-        o_seq = alignment.orig[seq[start][1]:seq[end][2]]
-        c_seq = alignment.cor[seq[start][3]:seq[end][4]]
-        o_toks = [tok.text.lower() for tok in o_seq]
-        c_toks = [tok.text.lower() for tok in c_seq]
-
-        if 'S' in subops:  # not just a word-order error
-            if 'M' not in subops:  # else should be split into several edits
-
-                # the last tokens differ in capitalization only
-                if o_toks[-1] == c_toks[-1]:
-                    if ((len(o_seq) == 1 and c_seq[0].text[0].isupper()) or
-                            (len(c_seq) == 1 and o_seq[0].text[0].isupper())):
-                        return merge_by_indices(start, end, seq, alignment)
-
-                    # merge the last two tokens if the second to last is punct
-                    if ((len(o_seq) > 1 and is_punct(o_seq[-2])) or
-                            (len(c_seq) > 1 and is_punct(c_seq[-2]))):
-                        return merge_by_indices(end - 1, end, seq, alignment)
-
-                # hyphens and whitespace
-                o_str = "".join(o_toks)
-                s = sub("['-]", "", o_str)
-                c_str = "".join(c_toks)
-                t = sub("['-]", "", c_str)
-                if s == t or (len(o_seq) + len(c_seq) <= 4 and
-                              (0 < o_str.find('-') < len(o_str) - 1 or
-                               0 < c_str.find('-') < len(c_str) - 1) and
-                              Levenshtein.ratio(s, t) >= .75):
-                    return merge_by_indices(start, end, seq, alignment)
-
-                # the same POS, auxiliary and reflexive verbs
-                o_pos_list = [tok.pos for tok in o_seq]
-                o_pos_set = set(o_pos_list)
-                c_pos_list = [tok.pos for tok in c_seq]
-                c_pos_set = set(c_pos_list)
-                pos_set = o_pos_set | c_pos_set
-                if ((len(o_seq) != len(c_seq) and (len(pos_set) == 1 or
-                                                   pos_set <= {'AUX', 'PART', 'VERB'} or
-                                                   {'VERB', 'PRON'} == o_pos_set or
-                                                   {'VERB', 'PRON'} == c_pos_set)) or
-                        # I have
-                        ({'VERB', 'PRON'} == o_pos_set and {'ADP', 'PRON'} == c_pos_set) or
-                        ({'VERB', 'PRON'} == c_pos_set and {'ADP', 'PRON'} == o_pos_set)):
-                    return merge_by_indices(start, end, seq, alignment)
-
-                # the same number and case
-                o_numcases = set([(tok.feats.get('Number'),
-                                   tok.feats.get('Case'))
-                                  for tok in o_seq])
-                c_numcases = set([(tok.feats.get('Number'),
-                                   tok.feats.get('Case'))
-                                  for tok in c_seq])
-                if len(o_numcases) == 1 == len(c_numcases) and o_numcases != c_numcases:
-                    return merge_by_indices(start, end, seq, alignment)
-
-                # prepositional government
-                o_cases = set([tok.feats.get('Case') for tok in o_seq])
-                c_cases = set([tok.feats.get('Case') for tok in c_seq])
-                if (o_pos_list[0] == 'ADP' == c_pos_list[0] and
-                        o_seq[0].text.lower() != c_seq[0].text.lower() and
-                        len(o_cases) == 2 == len(c_cases) and
-                        len(o_cases & c_cases) == 1):
-                    return merge_by_indices(start, end, seq, alignment)
-
-                # don't merge
-                if end - start < 2:
-                    if (len(o_seq) == len(c_seq) == 2 or
-                            (ops[start] == "S" and
-                             char_cost(o_seq[0], c_seq[0]) > 0.75) or
-                            (ops[end] == "S" and
-                             char_cost(o_seq[-1], c_seq[-1]) > 0.75)):
-                        return (process_seq(seq[:start + 1], alignment) +
-                                process_seq(seq[start + 1:], alignment))
+class SpanSets:
+    """ Sets of token features over spans of tokens. Every set is a bit mask of feature ids,
+    and the masks of spans are read from a sparse table of unions in constant time """
+
+    def __init__(self, values, ids):
+        masks = [1 << ids.setdefault(value, len(ids)) for value in values]
+        self.table = [masks]
+        width = 1
+        while 2 * width <= len(masks):
+            prev = self.table[-1]
+            self.table.append([prev[n] | prev[n + width] for n in range(len(masks) - 2 * width + 1)])
+            width *= 2
+
+    def __call__(self, start, end):
+        if start >= end:
+            return 0
+        level = (end - start).bit_length() - 1
+        row = self.table[level]
+        return row[start] | row[end - (1 << level)]
+
+
+def bits(ids, values):
+    mask = 0
+    for value in values:
+        mask |= 1 << ids.setdefault(value, len(ids))
+    return mask
+
+
+def count_bits(mask):
+    return bin(mask).count("1")
+
+
+# ids of parts of speech in span sets
+pos_ids = {}
+aux_pos = bits(pos_ids, ['AUX', 'PART', 'VERB'])
+verb_pron = bits(pos_ids, ['VERB', 'PRON'])
+adp_pron = bits(pos_ids, ['ADP', 'PRON'])
+
+
+class TextSpans:
+    """ Lowercased texts of spans of tokens joined without spaces, with and without
+    apostrophes and hyphens """
+
+    def __init__(self, low):
+        self.joined, self.offsets = self.concat(low)
+        self.stripped, self.stripped_offsets = self.concat([sub("['-]", "", text) for text in low])
+
+    @staticmethod
+    def concat(texts):
+        offsets = [0]
+        for text in texts:
+            offsets.append(offsets[-1] + len(text))
+        return "".join(texts), offsets
+
+    def text(self, start, end):
+        return self.joined[self.offsets[start]:self.offsets[end]]
+
+    def stripped_text(self, start, end):
+        return self.stripped[self.stripped_offsets[start]:self.stripped_offsets[end]]
+
+
+class RuleMerger:
+    """ Merging rules applied to the edits of an alignment. Features of the tokens are computed
+    once per alignment, the rules are checked on spans in constant time and their decisions
+    are memoized by span, so that the recursive processing of a sequence does not repeat them """
+
+    def __init__(self, alignment):
+        self.orig = alignment.orig
+        self.cor = alignment.cor
+        # ids of the values of span sets shared by the original and the corrected tokens
+        self.numcase_ids = {}
+        self.case_ids = {}
+        self.word_ids = {}
+
+    @cached_property
+    def o_low(self):
+        return [tok.text.lower() for tok in self.orig]
+
+    @cached_property
+    def c_low(self):
+        return [tok.text.lower() for tok in self.cor]
+
+    @cached_property
+    def o_text(self):
+        return TextSpans(self.o_low)
+
+    @cached_property
+    def c_text(self):
+        return TextSpans(self.c_low)
+
+    @cached_property
+    def o_pos(self):
+        return SpanSets([tok.pos for tok in self.orig], pos_ids)
+
+    @cached_property
+    def c_pos(self):
+        return SpanSets([tok.pos for tok in self.cor], pos_ids)
+
+    @cached_property
+    def o_numcases(self):
+        return SpanSets([(tok.feats.get('Number'), tok.feats.get('Case')) for tok in self.orig],
+                        self.numcase_ids)
+
+    @cached_property
+    def c_numcases(self):
+        return SpanSets([(tok.feats.get('Number'), tok.feats.get('Case')) for tok in self.cor],
+                        self.numcase_ids)
+
+    @cached_property
+    def o_cases(self):
+        return SpanSets([tok.feats.get('Case') for tok in self.orig], self.case_ids)
+
+    @cached_property
+    def c_cases(self):
+        return SpanSets([tok.feats.get('Case') for tok in self.cor], self.case_ids)
+
+    @cached_property
+    def o_words(self):
+        return SpanSets(self.o_low, self.word_ids)
+
+    @cached_property
+    def c_words(self):
+        return SpanSets(self.c_low, self.word_ids)
+
+    def merge(self, seq):
+        """ Processes a sequence of single-token edits, returning the merged ones """
+        self.seq = seq
+        self.ops = [op[0] for op in seq]
+        # Numbers of every operation before each position of the sequence
+        self.op_counts = {}
+        for name in "MSID":
+            counts = [0]
+            for op in self.ops:
+                counts.append(counts[-1] + (op == name))
+            self.op_counts[name] = counts
+        self.decisions = {}
+        self.results = {}
+        return self.process(0, len(seq), len(seq))
+
+    def count(self, op, start, end):
+        """ Number of operations op in seq[start:end + 1] """
+        counts = self.op_counts[op]
+        return counts[end + 1] - counts[start]
+
+    def process(self, start, end, max_len):
+        """ Merges edits in seq[start:end]. Spans longer than max_len are known not
+        to be merged by the rules which only depend on the span """
+        key = (start, end)
+        if key not in self.results:
+            self.results[key] = self.process_span(start, end, max_len)
+        return self.results[key]
+
+    def process_span(self, left, right, max_len):
+        # delete leading and trailing matches
+        ops = self.ops
+        while left < right and ops[left] == 'M':
+            left += 1
+        while right > left and ops[right - 1] == 'M':
+            right -= 1
+        seq = self.seq[left:right]
+        if len(seq) <= 1:
+            return seq
+        last = right - 1
+        if self.count('D', left, last) == len(seq) or self.count('I', left, last) == len(seq):
+            return merge_edits(seq)
+
+        # Loop through spans of adjacent edits, starting with the largest.
+        # Inserts in the tail are merged regardless of the longer spans
+        tail_len = min(len(seq), self.tail_inserts(left, last)) - 1
+        if tail_len > max_len:
+            return self.merge_span(left, last - tail_len, last, right, max_len)
+        for length in range(min(len(seq) - 1, max_len), 0, -1):
+            for start in range(left, right - length):
+                end = start + length
+                decision = self.decide(start, end)
+                if decision is None:
+                    if end == last and length <= tail_len:
+                        return self.merge_span(left, start, end, right, length)
+                elif decision == "split":
+                    return (self.process(left, start + 1, length) +
+                            self.process(start + 1, right, length))
+                elif decision == "last":
+                    return self.merge_span(left, end - 1, end, right, length)
+                else:
+                    return self.merge_span(left, start, end, right, length)
+
+        # sequences containing content words
+        seqs = []
+        for merge, group in groupby(seq, lambda x: x[0][0] != "M"):
+            if merge:
+                seqs += self.merge_by_content(list(group))
+        return seqs
+
+    def merge_span(self, left, start, end, right, max_len):
+        return (self.process(left, start, max_len) +
+                merge_edits(self.seq[start:end + 1]) +
+                self.process(end + 1, right, max_len))
+
+    def tail_inserts(self, left, last):
+        n = 0
+        while last - n >= left and self.ops[last - n] == 'I':
+            n += 1
+        return n
+
+    def decide(self, start, end):
+        """ Memoized decision of the rules for seq[start:end + 1]: "merge", "last" to merge
+        the last two edits, "split" to process the edits before and after start separately,
+        or None """
+        key = (start, end)
+        if key not in self.decisions:
+            self.decisions[key] = self.apply_rules(start, end)
+        return self.decisions[key]
+
+    def apply_rules(self, start, end):
+        seq = self.seq
+        o_start, o_end = seq[start][1], seq[end][2]
+        c_start, c_end = seq[start][3], seq[end][4]
+        o_len = o_end - o_start
+        c_len = c_end - c_start
+
+        if self.count('S', start, end):  # not just a word-order error
+            if self.count('M', start, end):  # else should be split into several edits
+                return None
+            o_first, o_last = self.orig[o_start], self.orig[o_end - 1]
+            c_first, c_last = self.cor[c_start], self.cor[c_end - 1]
+
+            # the last tokens differ in capitalization only
+            if self.o_low[o_end - 1] == self.c_low[c_end - 1]:
+                if ((o_len == 1 and c_first.text[0].isupper()) or
+                        (c_len == 1 and o_first.text[0].isupper())):
+                    return "merge"
+
+                # merge the last two tokens if the second to last is punct
+                if ((o_len > 1 and is_punct(self.orig[o_end - 2])) or
+                        (c_len > 1 and is_punct(self.cor[c_end - 2]))):
+                    return "last"
+
+            # hyphens and whitespace
+            s = self.o_text.stripped_text(o_start, o_end)
+            t = self.c_text.stripped_text(c_start, c_end)
+            if s == t:
+                return "merge"
+            if o_len + c_len <= 4:
+                o_str = self.o_text.text(o_start, o_end)
+                c_str = self.c_text.text(c_start, c_end)
+                if ((0 < o_str.find('-') < len(o_str) - 1 or
+                     0 < c_str.find('-') < len(c_str) - 1) and
+                        Levenshtein.ratio(s, t) >= .75):
+                    return "merge"
+
+            # the same POS, auxiliary and reflexive verbs
+            o_pos_set = self.o_pos(o_start, o_end)
+            c_pos_set = self.c_pos(c_start, c_end)
+            pos_set = o_pos_set | c_pos_set
+            if ((o_len != c_len and (count_bits(pos_set) == 1 or
+                                     not pos_set & ~aux_pos or
+                                     verb_pron == o_pos_set or
+                                     verb_pron == c_pos_set)) or
+                    # I have
+                    (verb_pron == o_pos_set and adp_pron == c_pos_set) or
+                    (verb_pron == c_pos_set and adp_pron == o_pos_set)):
+                return "merge"
+
+            # the same number and case
+            o_numcases = self.o_numcases(o_start, o_end)
+            c_numcases = self.c_numcases(c_start, c_end)
+            if count_bits(o_numcases) == 1 == count_bits(c_numcases) and o_numcases != c_numcases:
+                return "merge"
+
+            # prepositional government
+            o_cases = self.o_cases(o_start, o_end)
+            c_cases = self.c_cases(c_start, c_end)
+            if (o_first.pos == 'ADP' == c_first.pos and
+                    self.o_low[o_start] != self.c_low[c_start] and
+                    count_bits(o_cases) == 2 == count_bits(c_cases) and
+                    count_bits(o_cases & c_cases) == 1):
+                return "merge"
+
+            # don't merge
+            if end - start < 2:
+                if (o_len == c_len == 2 or
+                        (self.ops[start] == "S" and char_cost(o_first, c_first) > 0.75) or
+                        (self.ops[end] == "S" and char_cost(o_last, c_last) > 0.75)):
+                    return "split"
+            return None
 
         # no substitutions; maybe, word-order error
-        elif ((subops[0] != 'M' != subops[-1] and
-               subops.count('I') == subops.count('D') > 0 and
-               set(o_toks) == set(c_toks)) or
-              # merge inserts in the tail
-              (end == len(ops) - 1 and subops.count('I') == len(subops))):
-            return merge_by_indices(start, end, seq, alignment)
-
-    # sequences containing content words
-    seqs = []
-    for merge, group in groupby(seq, lambda x: x[0][0] != "M"):
-        if merge:
-            seqs += merge_by_content(list(group), alignment)
-    return seqs
+        # (inserts in the tail depend on the processed sequence and are checked separately)
+        n_ins = self.count('I', start, end)
+        if (self.ops[start] != 'M' != self.ops[end] and
+                n_ins == self.count('D', start, end) > 0 and
+                self.o_words(o_start, o_end) == self.c_words(c_start, c_end)):
+            return "merge"
+        return None
+
+    def merge_by_content(self, seq):
+        return merge_by_content(seq, self)
 
 
 def merge_by_content(seq, alignment):
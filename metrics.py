@@ -0,0 +1,158 @@
+""" In-process metrics of the annotator: latency histograms of the stages, tokens per stage,
+edits per pair and hit rates of the caches. A MetricsRegistry is a hook of Annotator, see
+Annotator.add_hook, and exports the metrics as JSON or in the Prometheus text format """
+
+import json
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+import classifier
+
+# Upper bounds of the latency buckets in seconds
+latency_buckets = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+# Upper bounds of the buckets of the number of edits per pair
+edit_buckets = [0, 1, 2, 3, 5, 10, 20, 50, 100]
+
+
+class Histogram:
+    """ Counts of the observed values by bucket, with their sum and count """
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """ Returns (upper bound, number of values not above it) pairs, the last bound is +Inf """
+        total = 0
+        result = []
+        for bound, count in zip(self.bounds + [float("inf")], self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def to_dict(self):
+        return {"buckets": {format_bound(bound): n for bound, n in self.cumulative()},
+                "sum": self.sum, "count": self.count}
+
+
+def format_bound(bound):
+    return "+Inf" if bound == float("inf") else "%g" % bound
+
+
+class MetricsRegistry:
+    """ Collects the spans reported by the annotators it is attached to. The annotators may
+    run in other threads than the one exporting the metrics """
+
+    def __init__(self):
+        self.latencies = {}
+        self.tokens = defaultdict(int)
+        self.edits_per_pair = Histogram(edit_buckets)
+        self.annotators = []
+        self.lock = threading.Lock()
+
+    def __call__(self, stage, seconds, counts):
+        with self.lock:
+            if stage not in self.latencies:
+                self.latencies[stage] = Histogram(latency_buckets)
+            self.latencies[stage].observe(seconds)
+            self.tokens[stage] += counts.get("tokens", 0)
+            if stage == "merge":
+                # Edits are merged once per pair
+                self.edits_per_pair.observe(counts["edits"])
+
+    def attach(self, annotator):
+        """ Adds the registry to the hooks of the annotator and reports the hit rates of its caches """
+        annotator.add_hook(self)
+        self.annotators.append(annotator)
+        return self
+
+    def detach(self, annotator):
+        annotator.remove_hook(self)
+        self.annotators.remove(annotator)
+
+    def caches(self):
+        """ Returns hits, misses and hit rates of the caches by name. The hits and misses of the
+        caches of processed texts are summed over the annotators """
+        caches = {}
+        for annotator in self.annotators:
+            processor = annotator.processor
+            if processor.cache_size > 0:
+                add_counts(caches, "docs", processor.cache_info())
+            if processor.store is not None:
+                add_counts(caches, "doc_store", processor.store.store_info())
+        for name, info in classifier.cache_info().items():
+            caches[name] = info
+        if classifier.ML:
+            from morph_ortho import get_cache
+            info = get_cache().cache_info()
+            caches["morph_ortho"] = dict(hits=info["memory_hits"] + info["disk_hits"],
+                                         misses=info["misses"])
+        result = {}
+        for name, info in caches.items():
+            calls = info["hits"] + info["misses"]
+            result[name] = {"hits": info["hits"], "misses": info["misses"],
+                            "hit_rate": info["hits"] / calls if calls else 0.0}
+        return result
+
+    def to_dict(self):
+        with self.lock:
+            stages = {stage: dict(histogram.to_dict(), tokens=self.tokens[stage])
+                      for stage, histogram in self.latencies.items()}
+            edits_per_pair = self.edits_per_pair.to_dict()
+        return {"stages": stages, "edits_per_pair": edits_per_pair, "caches": self.caches()}
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+    def save(self, path):
+        """ Writes the metrics to a JSON file """
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_json())
+
+    def to_prometheus(self):
+        """ Returns the metrics in the Prometheus text exposition format """
+        lines = ["# HELP annotator_stage_seconds Duration of the stages of the annotator",
+                 "# TYPE annotator_stage_seconds histogram"]
+        with self.lock:
+            for stage, histogram in self.latencies.items():
+                lines += histogram_lines("annotator_stage_seconds", histogram, 'stage="%s",' % stage)
+            lines += ["# HELP annotator_stage_tokens_total Tokens processed by the stages of the annotator",
+                      "# TYPE annotator_stage_tokens_total counter"]
+            for stage in self.latencies:
+                lines.append('annotator_stage_tokens_total{stage="%s"} %d' % (stage, self.tokens[stage]))
+            lines += ["# HELP annotator_edits_per_pair Number of edits extracted from a pair of texts",
+                      "# TYPE annotator_edits_per_pair histogram"]
+            lines += histogram_lines("annotator_edits_per_pair", self.edits_per_pair, "")
+        caches = self.caches()
+        for metric, key, type, help in [("hits_total", "hits", "counter", "Cache hits"),
+                                        ("misses_total", "misses", "counter", "Cache misses"),
+                                        ("hit_ratio", "hit_rate", "gauge", "Share of cache hits")]:
+            lines += ["# HELP annotator_cache_%s %s" % (metric, help),
+                      "# TYPE annotator_cache_%s %s" % (metric, type)]
+            for name, info in caches.items():
+                lines.append('annotator_cache_%s{cache="%s"} %s' % (metric, name, info[key]))
+        return "\n".join(lines) + "\n"
+
+
+def add_counts(caches, name, info):
+    total = caches.setdefault(name, {"hits": 0, "misses": 0})
+    total["hits"] += info["hits"]
+    total["misses"] += info["misses"]
+
+
+def histogram_lines(name, histogram, labels):
+    lines = ['%s_bucket{%sle="%s"} %d' % (name, labels, format_bound(bound), n)
+             for bound, n in histogram.cumulative()]
+    labels = "{%s}" % labels.rstrip(",") if labels else ""
+    lines.append("%s_sum%s %s" % (name, labels, histogram.sum))
+    lines.append("%s_count%s %d" % (name, labels, histogram.count))
+    return lines
@@ -1,39 +1,267 @@
-import numpy as np
-import torch
+import hashlib
+import os
+import sqlite3
+from collections import OrderedDict
 
-from datasets import ClassLabel
-from sklearn.preprocessing import MultiLabelBinarizer
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
+from resources import load
 
 
 multi_label_names = ['Ortho', 'Morph']
 num_labels = len(multi_label_names)
-multi_labels = ClassLabel(names=multi_label_names)
-
-mlb = MultiLabelBinarizer()
-mlb.fit([multi_labels.names])
 
 model_checkpoint = 'seq_clf/morph_ortho/roberta_custom_weighted'
 
 threshold = 0.5
 
-tokenizer = AutoTokenizer.from_pretrained(model_checkpoint, use_fast=True)
-rcw_model = AutoModelForSequenceClassification.from_pretrained(model_checkpoint, num_labels=num_labels,
+
+# Inference backend: torch, quantized (the torch model with int8 dynamic quantization
+# of the linear layers) or onnx (the graph saved by export_onnx, run with onnxruntime)
+backend = "torch"
+onnx_path = model_checkpoint + '/model.onnx'
+
+# Loaded tokenizers, models and label binarizers by backend
+models = {}
+
+
+def get_model():
+    """ Loads the tokenizer, the model of the current backend and the label binarizer on first use """
+    if backend not in models:
+        models[backend] = load("morph_ortho model (%s)" % backend, lambda: create_model(backend))
+    return models[backend]
+
+
+def create_model(backend):
+    if backend not in ("torch", "quantized", "onnx"):
+        raise Exception("Unknown backend. Choose from: torch, quantized, onnx.")
+    from datasets import ClassLabel
+    from sklearn.preprocessing import MultiLabelBinarizer
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+    multi_labels = ClassLabel(names=multi_label_names)
+    mlb = MultiLabelBinarizer()
+    mlb.fit([multi_labels.names])
+
+    tokenizer = AutoTokenizer.from_pretrained(model_checkpoint, use_fast=True)
+    if backend in ("torch", "quantized"):
+        rcw_model = AutoModelForSequenceClassification.from_pretrained(model_checkpoint, num_labels=num_labels,
+                                                                       problem_type='multi_label_classification'
+                                                                       )
+        if backend == "quantized":
+            import torch
+            rcw_model = torch.quantization.quantize_dynamic(rcw_model, {torch.nn.Linear}, dtype=torch.qint8)
+    else:
+        import onnxruntime
+        rcw_model = onnxruntime.InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
+    return tokenizer, rcw_model, mlb
+
+
+def export_onnx(path=onnx_path, quantize=False):
+    """ Saves the torch model as an ONNX graph for the onnx backend,
+    with int8 weights if quantize is set """
+    import torch
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+    tokenizer = AutoTokenizer.from_pretrained(model_checkpoint, use_fast=True)
+    model = AutoModelForSequenceClassification.from_pretrained(model_checkpoint, num_labels=num_labels,
                                                                problem_type='multi_label_classification'
                                                                )
+    model.eval()
+    inputs = tokenizer("пример", "пример", return_tensors='pt')
+    axes = {0: 'batch', 1: 'sequence'}
+    export_path = path + '.tmp' if quantize else path
+    torch.onnx.export(model, (inputs['input_ids'], inputs['attention_mask']), export_path,
+                      input_names=['input_ids', 'attention_mask'], output_names=['logits'],
+                      dynamic_axes={'input_ids': axes, 'attention_mask': axes, 'logits': {0: 'batch'}},
+                      opset_version=14)
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(export_path, path, weight_type=QuantType.QInt8)
+        os.remove(export_path)
+
 
+def get_annotation(quote, correction, tokenizer, model, mlb):
+    """ quote and correction are strings or lists of strings, padded to the longest pair.
+    tokenizer, model and mlb are those of get_model, model is a torch model or an onnxruntime session """
+    import numpy as np
 
-def get_annotation(quote, correction, tokenizer, model):
-    inputs = tokenizer(quote, correction, return_tensors='pt')
-    logits = model(**inputs).logits
-    probas = torch.sigmoid(logits)
-    predictions = np.array(torch.where(probas > threshold, 1, 0))
-    predictions = predictions.reshape(-1, multi_labels.num_classes)
+    if hasattr(model, 'get_inputs'):
+        inputs = tokenizer(quote, correction, padding=True, return_tensors='np')
+        names = [node.name for node in model.get_inputs()]
+        logits = model.run(['logits'], {name: inputs[name] for name in names})[0]
+    else:
+        import torch
+        inputs = tokenizer(quote, correction, padding=True, return_tensors='pt')
+        with torch.inference_mode():
+            logits = model(**inputs).logits.numpy()
+    probas = 1 / (1 + np.exp(-logits))
+    predictions = np.where(probas > threshold, 1, 0)
+    predictions = predictions.reshape(-1, num_labels)
     predictions = mlb.inverse_transform(predictions)
 
     return predictions
 
 
+def run_model(pairs, batch_size=32):
+    """ Labels of (quote, correction) pairs. Pairs of similar length are run through
+    the model together, batch_size pairs per forward pass """
+    if not pairs:
+        return []
+    tokenizer, rcw_model, mlb = get_model()
+    order = sorted(range(len(pairs)), key=lambda n: len(pairs[n][0]) + len(pairs[n][1]))
+    labels = [None] * len(pairs)
+    for start in range(0, len(order), batch_size):
+        ids = order[start:start + batch_size]
+        predictions = get_annotation([pairs[n][0] for n in ids], [pairs[n][1] for n in ids],
+                                     tokenizer, rcw_model, mlb)
+        for n, prediction in zip(ids, predictions):
+            labels[n] = prediction
+    return labels
+
+
+# SQLite file of the persistent prediction cache; None keeps the predictions in memory only
+cache_path = None
+cache_memory_size = 100000
+
+# Prediction caches by file, model and process
+caches = {}
+
+
+def checkpoint_fingerprint():
+    """ Identifies the model whose predictions are cached: the files of the checkpoint
+    with their sizes and modification times, the backend and the threshold """
+    fingerprint = hashlib.sha256()
+    # The cache itself may be stored with the checkpoint, along with the SQLite journal files
+    cache_prefix = os.path.abspath(cache_path) if cache_path else None
+    for name in sorted(os.listdir(model_checkpoint)):
+        path = os.path.join(model_checkpoint, name)
+        if os.path.isfile(path) and not (cache_prefix and os.path.abspath(path).startswith(cache_prefix)):
+            stat = os.stat(path)
+            fingerprint.update(("%s:%s:%s\n" % (name, stat.st_size, stat.st_mtime_ns)).encode())
+    fingerprint.update(("%s:%s" % (backend, threshold)).encode())
+    return fingerprint.hexdigest()
+
+
+class PredictionCache:
+    """ Labels of (quote, correction) pairs stored in SQLite by model fingerprint, so that
+    a new checkpoint never gets the predictions of an old one. The most recently used
+    predictions are kept in memory in front of the database """
+
+    def __init__(self, path, fingerprint, memory_size=100000):
+        self.fingerprint = fingerprint
+        self.memory_size = memory_size
+        self.memory = OrderedDict()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self.db = None
+        if path is not None:
+            self.db = sqlite3.connect(path, timeout=60)
+            # Several worker processes may use the same file
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS predictions (fingerprint TEXT, quote TEXT, "
+                            "correction TEXT, labels TEXT, PRIMARY KEY (fingerprint, quote, correction))")
+
+    def remember(self, pair, labels):
+        self.memory[pair] = labels
+        if len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+
+    def get_many(self, pairs):
+        """ Returns the labels of the cached pairs by pair """
+        found = {}
+        for pair in pairs:
+            if pair in self.memory:
+                self.memory.move_to_end(pair)
+                found[pair] = self.memory[pair]
+                self.stats["memory_hits"] += 1
+            elif self.db is not None:
+                row = self.db.execute("SELECT labels FROM predictions WHERE fingerprint = ? AND "
+                                      "quote = ? AND correction = ?", (self.fingerprint,) + pair).fetchone()
+                if row is not None:
+                    found[pair] = tuple(row[0].split(",")) if row[0] else ()
+                    self.remember(pair, found[pair])
+                    self.stats["disk_hits"] += 1
+        self.stats["misses"] += len(pairs) - len(found)
+        return found
+
+    def put_many(self, predictions):
+        """ Stores the labels of the given pairs """
+        for pair, labels in predictions.items():
+            self.remember(pair, labels)
+        if self.db is not None:
+            with self.db:
+                self.db.executemany("INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?)",
+                                    [(self.fingerprint,) + pair + (",".join(labels),)
+                                     for pair, labels in predictions.items()])
+
+    def prune(self):
+        """ Deletes the predictions of other models from the database """
+        if self.db is not None:
+            with self.db:
+                self.db.execute("DELETE FROM predictions WHERE fingerprint != ?", (self.fingerprint,))
+
+    def cache_info(self):
+        return dict(self.stats, size=len(self.memory), max_size=self.memory_size)
+
+
+def get_cache():
+    key = (cache_path, backend, threshold, os.getpid())
+    if key not in caches:
+        fingerprint = checkpoint_fingerprint() if cache_path is not None else None
+        caches[key] = PredictionCache(cache_path, fingerprint, cache_memory_size)
+    return caches[key]
+
+
+def predict(pairs, batch_size=32):
+    """ Labels of (quote, correction) pairs. Only the pairs missing from the prediction cache
+    are run through the model """
+    cache = get_cache()
+    found = cache.get_many(set(pairs))
+    missing = [pair for pair in dict.fromkeys(pairs) if pair not in found]
+    if missing:
+        predictions = dict(zip(missing, run_model(missing, batch_size)))
+        cache.put_many(predictions)
+        found.update(predictions)
+    return [found[pair] for pair in pairs]
+
+
+class MorphBatch:
+    """ Batch of is_morph calls made while classifying a batch of edits. While it is the current
+    batch (in a with block), is_morph queues unknown pairs and answers False for them,
+    run predicts the labels of all the queued pairs at once """
+
+    def __init__(self):
+        # Labels of the queued pairs, None until predicted
+        self.queued = {}
+        # Number of is_morph calls answered before their pairs were predicted
+        self.deferred = 0
+        self.collecting = True
+
+    def __enter__(self):
+        global batch
+        batch = self
+        return self
+
+    def __exit__(self, *args):
+        global batch
+        batch = None
+
+    def run(self, batch_size=32):
+        self.collecting = False
+        pairs = [pair for pair, labels in self.queued.items() if labels is None]
+        self.queued.update(zip(pairs, predict(pairs, batch_size)))
+
+
+# The batch is_morph is answering for, if any
+batch = None
+
+
 def is_morph(quote, correction):
-    predictions = get_annotation(quote, correction, tokenizer, rcw_model)
-    return predictions and 'Morph' in predictions[0]
+    pair = (quote, correction)
+    if batch is not None and batch.queued.get(pair) is not None:
+        labels = batch.queued[pair]
+    elif batch is not None and batch.collecting:
+        batch.queued[pair] = None
+        batch.deferred += 1
+        return False
+    else:
+        labels = predict([pair])[0]
+    return 'Morph' in labels
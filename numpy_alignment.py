@@ -0,0 +1,105 @@
+""" NumPy implementation of the alignment dynamic programming, used by Alignment(engine="numpy").
+Gives the same cost and operation matrices as Alignment.align, but computes substitution
+costs in bulk and fills the matrices one anti-diagonal at a time """
+
+import numpy as np
+from rapidfuzz.distance import Indel
+from rapidfuzz.process import cdist
+
+from alignment import get_trans_cost
+
+# Operation codes, transpositions of length k are stored as TRANS + k
+OPS = ["O", "M", "S", "I", "D"]
+NONE, MATCH, SUB, INS, DEL = range(5)
+TRANS = 3
+
+
+def encode(values, vocab):
+    return np.array([vocab.setdefault(value, len(vocab)) for value in values], dtype=np.int64)
+
+
+def get_sub_costs(orig, cor):
+    """ Substitution costs between every pair of tokens, equal to Alignment.get_sub_cost """
+    vocab = {}
+    o_texts = encode([o.text for o in orig], vocab)
+    c_texts = encode([c.text for c in cor], vocab)
+    o_low = encode([o.text.lower() for o in orig], vocab)
+    c_low = encode([c.text.lower() for c in cor], vocab)
+    o_lemmas = encode([o.lemma for o in orig], vocab)
+    c_lemmas = encode([c.lemma for c in cor], vocab)
+    o_pos = encode([o.pos for o in orig], vocab)
+    c_pos = encode([c.pos for c in cor], vocab)
+
+    lemma_cost = np.where(o_lemmas[:, None] == c_lemmas[None, :], 0, 0.499)
+    pos_cost = np.where(o_pos[:, None] == c_pos[None, :], 0, 0.5)
+    # Levenshtein.ratio is the normalized Indel similarity, computed here for all pairs at once
+    char_cost = 1 - cdist([o.text for o in orig], [c.text for c in cor],
+                          scorer=Indel.normalized_similarity, dtype=np.float64)
+    sub_costs = lemma_cost + pos_cost + char_cost
+    sub_costs[o_low[:, None] == c_low[None, :]] = 0
+    return sub_costs, o_texts[:, None] == c_texts[None, :]
+
+
+def get_trans_candidates(o_low, c_low):
+    """ A transposition ending at tokens i and j is only possible if o_low[i] occurs
+    in c_low[:j + 1] and c_low[j] occurs in o_low[:i + 1] """
+    o_first, c_first = {}, {}
+    for i, o in enumerate(o_low):
+        o_first.setdefault(o, i)
+    for j, c in enumerate(c_low):
+        c_first.setdefault(c, j)
+    o_in_c = np.array([c_first.get(o, len(c_low)) for o in o_low])
+    c_in_o = np.array([o_first.get(c, len(o_low)) for c in c_low])
+    return ((o_in_c[:, None] <= np.arange(len(c_low))[None, :]) &
+            (c_in_o[None, :] <= np.arange(len(o_low))[:, None]))
+
+
+def align(orig, cor):
+    """ Builds the cost and operation matrices, returned as lists like in Alignment.align """
+    o_len = len(orig)
+    c_len = len(cor)
+    o_low = [o.text.lower() for o in orig]
+    c_low = [c.text.lower() for c in cor]
+
+    cost = np.zeros((o_len + 1, c_len + 1), dtype=np.float64)
+    ops = np.full((o_len + 1, c_len + 1), NONE, dtype=np.int32)
+    cost[:, 0] = np.arange(o_len + 1)
+    cost[0, :] = np.arange(c_len + 1)
+    ops[1:, 0] = DEL
+    ops[0, 1:] = INS
+
+    if o_len and c_len:
+        sub_costs, matches = get_sub_costs(orig, cor)
+        candidates = get_trans_candidates(o_low, c_low) & ~matches
+
+        # Cells (i + 1, j + 1) with i + j == d only depend on the two previous anti-diagonals
+        for d in range(o_len + c_len - 1):
+            i = np.arange(max(0, d - c_len + 1), min(o_len, d + 1))
+            j = d - i
+            sub = cost[i, j] + sub_costs[i, j]
+            ins = cost[i + 1, j] + 1
+            dele = cost[i, j + 1] + 1
+            trans = np.full(len(i), np.inf)
+            trans_ops = np.zeros(len(i), dtype=np.int32)
+            # The search for a transposition stops at once if the previous cell on the diagonal
+            # has the same cost
+            walk = (i > 0) & (j > 0) & (cost[i, j] != cost[np.maximum(i - 1, 0), np.maximum(j - 1, 0)])
+            for n in np.flatnonzero(candidates[i, j] & walk):
+                trans[n], k = get_trans_cost(cost, o_low, c_low, i[n], j[n])
+                trans_ops[n] = TRANS + k + 1
+
+            # The first cheapest operation is selected, in the order: transposition, S, I, D
+            best = trans
+            op = trans_ops
+            for alt, alt_op in ((sub, SUB), (ins, INS), (dele, DEL)):
+                cheaper = alt < best
+                best = np.where(cheaper, alt, best)
+                op = np.where(cheaper, alt_op, op)
+
+            match = matches[i, j]
+            cost[i + 1, j + 1] = np.where(match, cost[i, j], best)
+            ops[i + 1, j + 1] = np.where(match, MATCH, op)
+
+    names = np.array(OPS + ["T" + str(code - TRANS) for code in range(len(OPS), ops.max() + 1)],
+                     dtype=object)
+    return cost.tolist(), names[ops].tolist()
@@ -0,0 +1,65 @@
+""" Parallel annotation of large corpora with a pool of worker processes """
+
+import multiprocessing
+import os
+from collections import deque
+from itertools import islice
+
+from annotator import Annotator
+
+# Every worker process keeps its own annotator, so the models are loaded once per worker,
+# with the (cache_size, store) it was created with
+annotator = None
+annotator_config = None
+
+
+def get_annotator(cache_size=0, store=None):
+    """ Returns the annotator of the process, created again when the configuration changes """
+    global annotator, annotator_config
+    if annotator is None or annotator_config != (cache_size, store):
+        annotator = Annotator(cache_size, store=store)
+        annotator.warmup()
+        annotator_config = (cache_size, store)
+    return annotator
+
+
+def init_worker(cache_size=0, store=None):
+    # With the fork start method the annotator created in the parent is inherited
+    get_annotator(cache_size, store)
+
+
+def annotate_chunk(pairs, batch_size, merging):
+    return annotator.annotate_batch(pairs, batch_size, merging)
+
+
+def chunks(pairs, chunksize):
+    pairs = iter(pairs)
+    while True:
+        chunk = list(islice(pairs, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+
+def annotate_parallel(pairs, processes=None, chunksize=64, batch_size=64,
+                      merging="rules", preload=True, cache_size=0, store=None):
+    """
+    Annotates an iterable of (original, corrected) pairs in a pool of processes.
+    Pairs are sent to the workers in chunks of chunksize, and the edit lists are
+    yielded in the input order. With preload the models are loaded before the workers
+    are forked, so that they are shared copy-on-write instead of loaded in every worker.
+    cache_size sets the size of the doc cache of every worker, and store is the path
+    of an on-disk store of processed docs shared by the workers.
+    """
+    if preload and multiprocessing.get_start_method() == "fork":
+        get_annotator(cache_size, store)
+    processes = processes or os.cpu_count()
+    with multiprocessing.Pool(processes, initializer=init_worker, initargs=(cache_size, store)) as pool:
+        # Only a few chunks per worker are queued at a time, so the input is read lazily
+        pending = deque()
+        for chunk in chunks(pairs, chunksize):
+            pending.append(pool.apply_async(annotate_chunk, (chunk, batch_size, merging)))
+            if len(pending) >= 2 * processes:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
@@ -0,0 +1,33 @@
+""" Heavy resources (models, analyzers, dictionaries) are created lazily, on first use.
+This module records how long each of them took to load """
+
+import time
+
+# Loading time in seconds of every resource loaded so far
+load_times = {}
+# Time spent on loading the resources a resource being loaded depends on
+nested_times = []
+
+
+def load(name, factory):
+    """ Creates a resource by calling factory and records its loading time,
+    not counting the resources it loads itself """
+    nested_times.append(0.0)
+    start = time.perf_counter()
+    try:
+        resource = factory()
+    finally:
+        total = time.perf_counter() - start
+        load_times[name] = total - nested_times.pop()
+        if nested_times:
+            nested_times[-1] += total
+    return resource
+
+
+def startup_report():
+    """ Returns a table with the loading times of the resources """
+    lines = ["%-30s %8s" % ("resource", "seconds")]
+    for name, seconds in sorted(load_times.items(), key=lambda x: -x[1]):
+        lines.append("%-30s %8.3f" % (name, seconds))
+    lines.append("%-30s %8.3f" % ("total", sum(load_times.values())))
+    return "\n".join(lines)
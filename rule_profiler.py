@@ -0,0 +1,143 @@
+""" Opt-in profiling of the classification rules. While enabled, the predicates of the
+rule chains in classifier are wrapped to count their calls, hits and time, and to record
+which rule decided the type of every edit. When disabled, the original functions are
+restored and the classifier runs without any overhead """
+
+import json
+import time
+from collections import defaultdict
+
+import classifier
+
+# Predicates of get_one_sided_type and get_two_sided_type in the order they are checked
+one_sided_rules = ["one_sided_tense", "one_sided_mode", "one_sided_aux", "one_sided_conj",
+                   "one_sided_ref", "one_sided_prep", "one_sided_punct"]
+two_sided_rules = ["punct", "capitalization", "word_order", "graph", "cs", "brev", "infinitive",
+                   "tense", "passive", "num", "gender", "wrong_case", "noun_case", "nominative",
+                   "agrnum", "agrpers", "agrgender", "refl", "asp", "impers", "com", "mode",
+                   "hyphen_ins", "hyphen_del", "space_ins", "space_del", "conj", "ref", "prep",
+                   "infl", "lex", "constr", "typical_ortho", "morph", "ortho"]
+chains = ["classify", "get_one_sided_type", "get_two_sided_type"]
+
+
+class RuleProfiler:
+    """ Call counts, hits and cumulative time of every rule, and the number of edits of every
+    type decided by every rule. A type is decided by the last rule which returned true, by
+    "default" if the chain fell through, or by "classify" for edits classified as UNK.
+    The first classification of an edit which classify_batch classifies again after running
+    the ML model is not counted """
+
+    def __init__(self):
+        self.originals = {}
+        self.calls = defaultdict(int)
+        self.hits = defaultdict(int)
+        self.seconds = defaultdict(float)
+        self.decisions = defaultdict(lambda: defaultdict(int))
+        self.depth = 0
+        self.last = None
+        # (name, seconds, hit) of the rules and chains called by the classify being run
+        self.events = None
+
+    def __enter__(self):
+        return self.enable()
+
+    def __exit__(self, *args):
+        self.disable()
+
+    def enable(self):
+        if not self.originals:
+            for name in one_sided_rules + two_sided_rules:
+                self.originals[name] = getattr(classifier, name)
+                setattr(classifier, name, self.wrap_rule(name, self.originals[name]))
+            for name in chains:
+                self.originals[name] = getattr(classifier, name)
+                setattr(classifier, name, self.wrap_chain(name, self.originals[name]))
+        return self
+
+    def disable(self):
+        for name, function in self.originals.items():
+            setattr(classifier, name, function)
+        self.originals = {}
+
+    def wrap_rule(self, name, function):
+        def rule(*args):
+            # Only the rules called by the chains are counted, not the rules they call
+            self.depth += 1
+            start = time.perf_counter()
+            try:
+                result = function(*args)
+            finally:
+                self.depth -= 1
+            if self.depth == 0:
+                self.record(name, time.perf_counter() - start, bool(result))
+                if result:
+                    self.last = name
+            return result
+        return rule
+
+    def wrap_chain(self, name, function):
+        def chain(*args):
+            if name != "classify":
+                self.last = "default"
+                start = time.perf_counter()
+                result = function(*args)
+                self.record(name, time.perf_counter() - start, False)
+                return result
+            self.last = "classify"
+            self.events = []
+            deferred = classifier.deferred_count()
+            start = time.perf_counter()
+            try:
+                result = function(*args)
+            finally:
+                events, self.events = self.events, None
+            if classifier.deferred_count() == deferred:
+                for event in events + [(name, time.perf_counter() - start, False)]:
+                    self.record(*event)
+                self.decisions[result.type][self.last] += 1
+            return result
+        return chain
+
+    def record(self, name, seconds, hit):
+        if self.events is not None:
+            self.events.append((name, seconds, hit))
+            return
+        self.seconds[name] += seconds
+        self.calls[name] += 1
+        if hit:
+            self.hits[name] += 1
+
+    def to_dict(self):
+        rules = {}
+        for name in chains + one_sided_rules + two_sided_rules:
+            if self.calls[name]:
+                rules[name] = {"calls": self.calls[name], "hits": self.hits[name],
+                               "seconds": self.seconds[name]}
+        return {"rules": rules,
+                "decisions": {type: dict(by_rule) for type, by_rule in self.decisions.items()}}
+
+    def save(self, path):
+        """ Writes the statistics to a JSON file """
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+    def report(self):
+        """ Returns a table of the rules sorted by cumulative time """
+        decided = defaultdict(int)
+        for by_rule in self.decisions.values():
+            for rule, n in by_rule.items():
+                decided[rule] += n
+        lines = ["%-20s %9s %9s %9s %10s %9s" % ("rule", "calls", "hits", "decided",
+                                                   "total, ms", "us/call")]
+        stats = self.to_dict()["rules"]
+        for name, rule in sorted(stats.items(), key=lambda x: -x[1]["seconds"]):
+            lines.append("%-20s %9d %9s %9s %10.1f %9.1f" % (
+                name, rule["calls"], rule["hits"] if name not in chains else "",
+                decided[name] if name not in chains else "", rule["seconds"] * 1000,
+                rule["seconds"] / rule["calls"] * 1e6))
+        lines += ["", "%-20s %-20s %9s" % ("type", "decided by", "edits")]
+        decisions = [(type, rule, n) for type, by_rule in self.decisions.items()
+                     for rule, n in by_rule.items()]
+        for type, rule, n in sorted(decisions, key=lambda x: -x[2]):
+            lines.append("%-20s %-20s %9d" % (type, rule, n))
+        return "\n".join(lines)
@@ -0,0 +1,281 @@
+""" Asyncio HTTP service for annotating many small concurrent requests. Pairs of all the requests
+are queued and annotated together in micro-batches bounded by size and waiting time, in a worker
+thread, so that the event loop keeps accepting requests while natasha and the classifier run.
+Run: python server.py --port 8000 (or --unix /tmp/annotator.sock)
+
+POST /annotate {"orig": ..., "cor": ..., "merging": "rules"} returns {"edits": [...]},
+{"pairs": [[orig, cor], ...]} returns {"results": [[...], ...]}.
+GET /health returns the queue depth, GET /metrics the metrics in the Prometheus format (with --metrics).
+Requests are rejected with 503 while the queue is full or the server is shutting down """
+
+import argparse
+import asyncio
+import json
+import signal
+from concurrent.futures import ThreadPoolExecutor
+
+from annotator import Annotator
+from metrics import MetricsRegistry
+
+merging_algorithms = ["rules", "all-split", "all-merge", "all-equal"]
+
+reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large",
+           500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class AnnotationServer:
+    """ Queues the pairs of incoming requests and annotates them in micro-batches of up to
+    max_batch_size pairs, waiting at most max_wait seconds for a batch to fill up.
+    At most max_queue pairs may wait, further requests are rejected """
+
+    def __init__(self, annotator, max_batch_size=32, max_wait=0.01, max_queue=1024,
+                 max_body_size=1 << 20, registry=None):
+        self.annotator = annotator
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.max_body_size = max_body_size
+        self.registry = registry
+        self.queue = None
+        self.pending = 0
+        self.closing = False
+        self.writers = set()
+        # Connections with a request being handled
+        self.busy = 0
+        self.server = None
+        self.batcher = None
+        # The annotator is not thread-safe, so all the batches run in one thread
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    async def start(self, host="127.0.0.1", port=8000, unix=None):
+        self.queue = asyncio.Queue()
+        self.batcher = asyncio.create_task(self.run_batches())
+        if unix is not None:
+            self.server = await asyncio.start_unix_server(self.handle, unix)
+        else:
+            self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server
+
+    async def shutdown(self):
+        """ Stops accepting requests, answers the queued ones and closes the connections """
+        self.closing = True
+        self.server.close()
+        await self.queue.join()
+        # Requests already received on open connections are answered, with 503 if not queued yet
+        await asyncio.sleep(0)
+        while self.busy:
+            await asyncio.sleep(0.01)
+        for writer in list(self.writers):
+            writer.close()
+        await self.queue.put(None)
+        await self.batcher
+        self.executor.shutdown()
+
+    async def submit(self, pairs, merging="rules"):
+        """ Queues the pairs and returns their edits as dictionaries once they are annotated """
+        if self.closing:
+            raise HTTPError(503, "Shutting down")
+        if self.pending + len(pairs) > self.max_queue:
+            raise HTTPError(503, "Queue is full")
+        loop = asyncio.get_running_loop()
+        futures = []
+        for pair in pairs:
+            future = loop.create_future()
+            self.queue.put_nowait((pair, merging, future))
+            futures.append(future)
+        self.pending += len(pairs)
+        return await asyncio.gather(*futures)
+
+    async def run_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            batch = [item]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                try:
+                    item = self.queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self.queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is None:
+                    # Shutdown comes after all the queued pairs, put it back for the next round
+                    self.queue.task_done()
+                    self.queue.put_nowait(None)
+                    break
+                batch.append(item)
+            await self.run_batch(batch)
+
+    async def run_batch(self, batch):
+        loop = asyncio.get_running_loop()
+        by_merging = {}
+        for item in batch:
+            by_merging.setdefault(item[1], []).append(item)
+        for merging, items in by_merging.items():
+            pairs = [pair for pair, _, _ in items]
+            try:
+                results = await loop.run_in_executor(self.executor, self.annotate, pairs, merging)
+            except Exception:
+                # The pairs are annotated one by one, so that only the requests with a failing pair fail
+                results = []
+                for pair in pairs:
+                    try:
+                        results += await loop.run_in_executor(self.executor, self.annotate, [pair], merging)
+                    except Exception as e:
+                        results.append(e)
+            for (_, _, future), result in zip(items, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+        self.pending -= len(batch)
+        for _ in batch:
+            self.queue.task_done()
+
+    def annotate(self, pairs, merging):
+        results = self.annotator.annotate_batch(pairs, len(pairs), merging)
+        return [[edit.to_dict() for edit in edits] for edits in results]
+
+    async def handle(self, reader, writer):
+        self.writers.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                self.busy += 1
+                try:
+                    keep_alive = await self.handle_request(reader, writer, request_line)
+                finally:
+                    self.busy -= 1
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+    async def handle_request(self, reader, writer, request_line):
+        """ Reads the rest of a request and responds to it. Returns whether to keep the connection """
+        method, path, _ = request_line.decode("latin-1").split(" ", 2)
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", 0))
+        if length > self.max_body_size:
+            await self.respond(writer, 413, {"error": "Request body is too large"}, False)
+            return False
+        body = await reader.readexactly(length) if length else b""
+        keep_alive = headers.get("connection", "").lower() != "close" and not self.closing
+        try:
+            status, response = 200, await self.route(method, path, body)
+        except HTTPError as e:
+            status, response = e.status, {"error": str(e)}
+        except Exception as e:
+            status, response = 500, {"error": str(e)}
+        keep_alive = keep_alive and not self.closing
+        await self.respond(writer, status, response, keep_alive)
+        return keep_alive
+
+    async def route(self, method, path, body):
+        if method == "GET" and path == "/health":
+            return {"status": "closing" if self.closing else "ok", "queue": self.pending}
+        if method == "GET" and path == "/metrics" and self.registry is not None:
+            return self.registry.to_prometheus()
+        if method != "POST" or path != "/annotate":
+            raise HTTPError(404, "Unknown path. Choose from: POST /annotate, GET /health, GET /metrics.")
+        try:
+            request = json.loads(body)
+        except ValueError:
+            raise HTTPError(400, "Request body is not JSON")
+        if not isinstance(request, dict):
+            raise HTTPError(400, "Request body is not a JSON object")
+        merging = request.get("merging", "rules")
+        if merging not in merging_algorithms:
+            raise HTTPError(400, "Unknown merging algorithm. Choose from: "
+                                 "rules, all-split, all-merge, all-equal.")
+        if "pairs" in request:
+            try:
+                pairs = [(orig, cor) for orig, cor in request["pairs"]]
+            except (TypeError, ValueError):
+                pairs = None
+            if pairs is None or not all(isinstance(text, str) for pair in pairs for text in pair):
+                raise HTTPError(400, "pairs must be a list of [orig, cor] pairs of strings")
+            return {"results": await self.submit(pairs, merging)}
+        if "orig" in request and "cor" in request:
+            if not isinstance(request["orig"], str) or not isinstance(request["cor"], str):
+                raise HTTPError(400, "orig and cor must be strings")
+            return {"edits": (await self.submit([(request["orig"], request["cor"])], merging))[0]}
+        raise HTTPError(400, "Pass orig and cor, or pairs")
+
+    async def respond(self, writer, status, response, keep_alive):
+        if isinstance(response, str):
+            body, content_type = response.encode(), "text/plain; version=0.0.4"
+        else:
+            body, content_type = json.dumps(response, ensure_ascii=False).encode(), "application/json"
+        head = ["HTTP/1.1 %d %s" % (status, reasons[status]),
+                "Content-Type: %s" % content_type,
+                "Content-Length: %d" % len(body),
+                "Connection: %s" % ("keep-alive" if keep_alive else "close")]
+        if status == 503:
+            head.append("Retry-After: 1")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + body)
+        await writer.drain()
+
+
+async def serve(server, host, port, unix):
+    await server.start(host, port, unix)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+    await server.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serves the annotator over HTTP with micro-batching.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--unix", help="Listen on a Unix socket instead of TCP")
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=10,
+                        help="How long the first pair of a batch waits for more pairs")
+    parser.add_argument("--max-queue", type=int, default=1024,
+                        help="Pairs that may wait for annotation before requests are rejected")
+    parser.add_argument("--cache-size", type=int, default=0)
+    parser.add_argument("--store", help="SQLite file of processed texts reused across runs")
+    parser.add_argument("--metrics", action="store_true", help="Collect metrics and serve them on /metrics")
+    args = parser.parse_args(argv)
+
+    annotator = Annotator(args.cache_size, store=args.store)
+    annotator.warmup()
+    registry = MetricsRegistry().attach(annotator) if args.metrics else None
+    server = AnnotationServer(annotator, args.max_batch_size, args.max_wait_ms / 1000, args.max_queue,
+                              registry=registry)
+    asyncio.run(serve(server, args.host, args.port, args.unix))
+
+
+if __name__ == "__main__":
+    main()
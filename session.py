@@ -0,0 +1,128 @@
+""" Incremental re-annotation of a multi-sentence text whose correction is being edited.
+The texts are split into sentences, and the sentences of the original are aligned with those of
+the correction. A pair of sentences that was annotated before keeps its edits, which are only
+shifted to the new offsets, so that only the changed sentences are processed, aligned and classified """
+
+from Levenshtein import ratio
+
+from edit import Edit
+from token_store import concat_stores
+
+
+# Numbers of original and corrected sentences a chunk can have
+chunk_shapes = [(1, 1), (1, 0), (0, 1), (2, 1), (1, 2)]
+
+
+class AnnotationSession:
+    """ Annotates successive versions of a text and its correction. The sentences are aligned
+    into chunks of one original and one corrected sentence, or of two sentences on one side where
+    the correction splits or merges sentences, or of a single added or deleted sentence.
+    The edits of a chunk are those of Annotator.annotate on the texts of the chunk """
+
+    def __init__(self, annotator, merging="rules", band=3):
+        self.annotator = annotator
+        self.merging = merging
+        # Sentence i of the original is only aligned with sentences i - band to i + band
+        # of the correction, in addition to the difference in the number of sentences
+        self.band = band
+        # Annotated chunks by their (original sentences, corrected sentences):
+        # token stores of the two sides and the edits with offsets in the chunk
+        self.chunks = {}
+        self.stats = {"chunks": 0, "annotated": 0}
+
+    def sentences(self, text):
+        """ Returns the texts of the sentences and their offsets in the text """
+        sents = list(self.annotator.processor.segmenter.sentenize(text))
+        return tuple(sent.text for sent in sents), [sent.start for sent in sents]
+
+    def cost(self, chunk):
+        if chunk in self.chunks:
+            # Chunks annotated before are kept
+            return 0.0
+        o_sents, c_sents = chunk
+        if not o_sents or not c_sents:
+            return 1.0
+        return 1.0 - ratio(" ".join(o_sents), " ".join(c_sents))
+
+    def pair(self, o_sents, c_sents):
+        """ Splits the sentences into chunks of (original sentences, corrected sentences)
+        with the lowest total dissimilarity """
+        o_len, c_len = len(o_sents), len(c_sents)
+        band = abs(o_len - c_len) + self.band
+        costs = {(0, 0): (0.0, None)}
+        for i in range(o_len + 1):
+            for j in range(max(0, i - band), min(c_len, i + band) + 1):
+                for o_n, c_n in chunk_shapes:
+                    previous = costs.get((i - o_n, j - c_n))
+                    if previous is None:
+                        continue
+                    cost = previous[0] + self.cost((o_sents[i - o_n:i], c_sents[j - c_n:j]))
+                    if (i, j) not in costs or cost < costs[i, j][0]:
+                        costs[i, j] = (cost, (o_n, c_n))
+        chunks = []
+        i, j = o_len, c_len
+        while i or j:
+            o_n, c_n = costs[i, j][1]
+            chunks.append((o_sents[i - o_n:i], c_sents[j - c_n:j]))
+            i, j = i - o_n, j - c_n
+        return chunks[::-1]
+
+    def annotate(self, chunks):
+        """ Processes, aligns, merges and classifies new chunks """
+        texts = [" ".join(sents) for chunk in chunks for sents in chunk]
+        docs = self.annotator.process_batch(texts)
+        new_edits = []
+        for chunk, orig, cor in zip(chunks, docs[::2], docs[1::2]):
+            alignment = self.annotator.align_docs(orig, cor)
+            edits = self.annotator.merge(alignment, self.merging)
+            self.chunks[chunk] = (alignment.o_store, alignment.c_store, edits)
+            new_edits += edits
+        self.annotator.classify_batch(new_edits)
+
+    def update(self, orig, cor):
+        """ Returns the edits of the current versions of the texts, with the offsets of the tokens
+        in the whole texts. Only the chunks that changed since the last update are annotated """
+        o_sents, o_starts = self.sentences(orig)
+        c_sents, c_starts = self.sentences(cor)
+        chunks = self.pair(o_sents, c_sents)
+        new = [chunk for chunk in chunks if chunk not in self.chunks]
+        if new:
+            self.annotate(list(dict.fromkeys(new)))
+        self.stats = {"chunks": len(chunks), "annotated": len(new)}
+
+        # Chunks that are gone are forgotten
+        current = {chunk: self.chunks[chunk] for chunk in chunks}
+        self.chunks = current
+        # The sentences of a chunk are processed joined by spaces, the character offsets of their
+        # tokens are moved to the sentences in the whole texts
+        o_offsets, c_offsets = [], []
+        o_sent = c_sent = 0
+        for chunk_o_sents, chunk_c_sents in chunks:
+            o_offsets.append(segment_offsets(chunk_o_sents, o_starts[o_sent:]))
+            c_offsets.append(segment_offsets(chunk_c_sents, c_starts[c_sent:]))
+            o_sent += len(chunk_o_sents)
+            c_sent += len(chunk_c_sents)
+        o_store = concat_stores([current[chunk][0] for chunk in chunks], o_offsets)
+        c_store = concat_stores([current[chunk][1] for chunk in chunks], c_offsets)
+        edits = []
+        o_offset = c_offset = 0
+        for chunk in chunks:
+            o_chunk, c_chunk, chunk_edits = current[chunk]
+            for edit in chunk_edits:
+                edits.append(Edit(o_store, c_store,
+                                  (edit.o_start + o_offset, edit.o_end + o_offset,
+                                   edit.c_start + c_offset, edit.c_end + c_offset), edit.type))
+            o_offset += len(o_chunk)
+            c_offset += len(c_chunk)
+        return edits
+
+
+def segment_offsets(sents, starts):
+    """ (offset in the chunk text, offset in the whole text) pairs of the starts of the sentences
+    of a chunk, given the offsets of the sentences in the whole text from the first of the chunk """
+    offsets = []
+    offset = 0
+    for sent, start in zip(sents, starts):
+        offsets.append((offset, start))
+        offset += len(sent) + 1
+    return offsets
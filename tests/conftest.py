@@ -0,0 +1,35 @@
+""" Fixtures shared by the tests. The modules of the annotator are imported from the repository root """
+
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from annotator import Annotator  # noqa: E402
+
+data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+merging_algorithms = ["rules", "all-split", "all-merge", "all-equal"]
+
+
+def spans(edits):
+    return [[edit.o_start, edit.o_end, edit.c_start, edit.c_end] for edit in edits]
+
+
+def labelled(edits):
+    return [[edit.o_start, edit.o_end, edit.c_start, edit.c_end, edit.type] for edit in edits]
+
+
+@pytest.fixture(scope="session")
+def baseline():
+    """ Sentence and paragraph pairs with their alignment and their edits by merging algorithm,
+    as produced by the original annotator before the optimizations """
+    with open(os.path.join(data_dir, "baseline.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope="session")
+def annotator():
+    return Annotator()
@@ -0,0 +1,143 @@
+import random
+
+import pytest
+
+from alignment import Alignment, get_trans_cost
+from annotator import Annotator
+from conftest import labelled
+from document_alignment import DocumentAlignment
+
+
+@pytest.fixture(scope="module")
+def docs(annotator, baseline):
+    """ Processed (original, corrected) docs of the baseline pairs """
+    return [(annotator.process(pair["orig"]), annotator.process(pair["cor"])) for pair in baseline]
+
+
+def align_seq(alignment):
+    return [list(op) for op in alignment.align_seq]
+
+
+def test_numpy_engine_matches_baseline(docs, baseline):
+    pytest.importorskip("numpy")
+    pytest.importorskip("rapidfuzz")
+    for (orig, cor), pair in zip(docs, baseline):
+        assert align_seq(Alignment(orig, cor, engine="numpy")) == pair["align_seq"]
+
+
+def test_numpy_engine_matrices(docs):
+    pytest.importorskip("numpy")
+    pytest.importorskip("rapidfuzz")
+    for orig, cor in docs[:20]:
+        python = Alignment(orig, cor, trim=False)
+        numpy = Alignment(orig, cor, engine="numpy", trim=False)
+        for numpy_row, python_row in zip(numpy.cost_matrix, python.cost_matrix):
+            assert numpy_row == pytest.approx(python_row)
+        assert numpy.op_matrix == python.op_matrix
+
+
+def test_numpy_engine_shuffled_tokens(docs):
+    """ Unrelated token orders, with many transpositions and ties """
+    pytest.importorskip("numpy")
+    pytest.importorskip("rapidfuzz")
+    rng = random.Random(0)
+    for orig, _ in docs[:20]:
+        cor = type(orig)(orig.text)
+        cor.tokens = rng.sample(orig.tokens, len(orig.tokens))
+        assert Alignment(orig, cor, engine="numpy").align_seq == Alignment(orig, cor).align_seq
+
+
+def test_unknown_engine(docs):
+    orig, cor = docs[0]
+    with pytest.raises(Exception, match="Unknown alignment engine"):
+        Alignment(orig, cor, engine="fortran")
+
+
+def test_trimmed_alignment_matches_baseline(docs, baseline):
+    for (orig, cor), pair in zip(docs, baseline):
+        alignment = Alignment(orig, cor)
+        assert align_seq(alignment) == pair["align_seq"]
+        assert align_seq(Alignment(orig, cor, trim=False)) == pair["align_seq"]
+
+
+def test_common_affixes(annotator):
+    orig = annotator.process("Я я пошёл домой вчера вечером.")
+    cor = annotator.process("Я пошёл домой вчера вечером.")
+    alignment = Alignment(orig, cor)
+    # The repeated token is not part of the prefix, the suffix stops before the prefix
+    assert (alignment.prefix, alignment.suffix) == (1, 5)
+    identical = Alignment(orig, orig)
+    assert identical.prefix + identical.suffix == len(orig.tokens)
+    assert {op[0] for op in identical.align_seq} == {"M"}
+
+
+def sorted_trans_cost(cost_matrix, o_low, c_low, i, j):
+    """ The transposition search of the original alignment, which sorts the spans for every k """
+    k = 1
+    while i - k >= 0 and j - k >= 0 and \
+            cost_matrix[i - k + 1][j - k + 1] != cost_matrix[i - k][j - k]:
+        if sorted(o_low[i - k:i + 1]) == sorted(c_low[j - k:j + 1]):
+            return cost_matrix[i - k][j - k] + k, k
+        k += 1
+    return float("inf"), None
+
+
+def test_trans_cost_matches_sorting():
+    rng = random.Random(0)
+    for _ in range(300):
+        o_low = [rng.choice("abcd") for _ in range(rng.randint(1, 9))]
+        c_low = [rng.choice("abcd") for _ in range(rng.randint(1, 9))]
+        cost_matrix = [[rng.randint(0, 3) for _ in range(len(c_low) + 1)] for _ in range(len(o_low) + 1)]
+        for i in range(len(o_low)):
+            for j in range(len(c_low)):
+                cost, k = get_trans_cost(cost_matrix, o_low, c_low, i, j)
+                expected_cost, expected_k = sorted_trans_cost(cost_matrix, o_low, c_low, i, j)
+                assert cost == expected_cost
+                if expected_k is not None:
+                    assert k == expected_k
+
+
+def test_transpositions_match_baseline(docs, baseline):
+    transposed = [(orig, cor, pair) for (orig, cor), pair in zip(docs, baseline)
+                  if any(op[0].startswith("T") for op in pair["align_seq"])]
+    assert transposed
+    for orig, cor, pair in transposed:
+        assert align_seq(Alignment(orig, cor)) == pair["align_seq"]
+
+
+def covers(align_seq, o_len, c_len):
+    """ Whether the operations follow each other from the start to the end of both texts """
+    o_pos = c_pos = 0
+    for op, o_start, o_end, c_start, c_end in align_seq:
+        if (o_start, c_start) != (o_pos, c_pos):
+            return False
+        o_pos, c_pos = o_end, c_end
+    return (o_pos, c_pos) == (o_len, c_len)
+
+
+def test_document_mode_short_texts_match_baseline(baseline):
+    annotator = Annotator(document=True)
+    for pair in baseline:
+        orig, cor = annotator.process(pair["orig"]), annotator.process(pair["cor"])
+        if len(orig.tokens) + len(cor.tokens) < 200:
+            assert labelled(annotator.annotate(pair["orig"], pair["cor"])) == pair["edits"]["rules"]
+
+
+def test_document_alignment_matches_whole_alignment(annotator, baseline):
+    """ The pairs of sentences of the baseline joined into an essay; the alignment is split
+    at the unchanged sentences and the n-grams occurring once """
+    pairs = baseline[:40]
+    orig = annotator.process(" ".join(pair["orig"] for pair in pairs))
+    cor = annotator.process(" ".join(pair["cor"] for pair in pairs))
+    alignment = DocumentAlignment(orig, cor, min_tokens=0)
+    assert len(alignment.chunks) > 1
+    assert alignment.align_seq == Alignment(orig, cor).align_seq
+
+
+def test_document_alignment_anchors(docs):
+    for orig, cor in docs:
+        alignment = DocumentAlignment(orig, cor, min_tokens=0)
+        assert covers(alignment.align_seq, len(orig.tokens), len(cor.tokens))
+        for i, j in alignment.matches:
+            assert orig.tokens[i].text == cor.tokens[j].text
+            assert ("M", i, i + 1, j, j + 1) in alignment.align_seq
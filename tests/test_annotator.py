@@ -0,0 +1,34 @@
+from conftest import labelled
+
+
+def test_annotate_batch_matches_baseline(annotator, baseline):
+    pairs = [(pair["orig"], pair["cor"]) for pair in baseline]
+    # The last batch is smaller than the others
+    results = annotator.annotate_batch(pairs, batch_size=16)
+    assert [labelled(edits) for edits in results] == [pair["edits"]["rules"] for pair in baseline]
+
+
+def test_annotate_batch_merging(annotator, baseline):
+    pairs = [(pair["orig"], pair["cor"]) for pair in baseline[:10]]
+    results = annotator.annotate_batch(pairs, batch_size=4, merging="all-split")
+    assert [labelled(edits) for edits in results] == [pair["edits"]["all-split"] for pair in baseline[:10]]
+
+
+def test_annotate_batch_empty(annotator):
+    assert annotator.annotate_batch([]) == []
+
+
+def test_annotate_many_matches_baseline(annotator, baseline):
+    for pair in baseline:
+        # The original is also its own correction, without edits
+        results = annotator.annotate_many(pair["orig"], [pair["cor"], pair["orig"]])
+        assert [labelled(edits) for edits in results] == [pair["edits"]["rules"], []]
+
+
+def test_annotate_many_matches_annotate(annotator, baseline):
+    orig = baseline[0]["orig"]
+    cors = [pair["cor"] for pair in baseline[:5]]
+    results = annotator.annotate_many(orig, cors, merging="all-split")
+    assert [labelled(edits) for edits in results] == \
+        [labelled(annotator.annotate(orig, cor, "all-split")) for cor in cors]
+    assert annotator.annotate_many(orig, []) == []
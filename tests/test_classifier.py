@@ -0,0 +1,38 @@
+import inspect
+import re
+
+import classifier
+from conftest import labelled
+
+
+def test_types_match_baseline(annotator, baseline):
+    for pair in baseline:
+        alignment = annotator.align(pair["orig"], pair["cor"])
+        edits = annotator.merge(alignment)
+        assert labelled(classifier.classify(edit) for edit in edits) == pair["edits"]["rules"]
+
+
+def test_classify_batch_matches_classify(annotator, baseline):
+    edits = []
+    for pair in baseline:
+        edits += annotator.merge(annotator.align(pair["orig"], pair["cor"]))
+    classifier.classify_batch(edits)
+    assert labelled(edits) == [edit for pair in baseline for edit in pair["edits"]["rules"]]
+
+
+# Predicates of get_two_sided_type called with the feature bundle
+feature_rules = re.findall(r"if (\w+)\(f\):", inspect.getsource(classifier.get_two_sided_type))
+
+
+def test_shared_features(annotator, baseline):
+    """ Predicates give the same answers with one feature bundle shared by all of them
+    as with a fresh bundle each """
+    for pair in baseline:
+        for edit in annotator.merge(annotator.align(pair["orig"], pair["cor"])):
+            o_toks, c_toks = edit.o_toks, edit.c_toks
+            if not o_toks or not c_toks:
+                continue
+            shared = classifier.EditFeatures(o_toks, c_toks)
+            for name in feature_rules:
+                rule = getattr(classifier, name)
+                assert rule(shared) == rule(classifier.EditFeatures(o_toks, c_toks)), name
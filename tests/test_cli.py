@@ -0,0 +1,96 @@
+import io
+import json
+import sys
+
+import pytest
+
+import cli
+from edit import Edit
+from token_store import Token
+
+
+def test_read_tsv(capsys):
+    lines = ["Я пошел.\tЯ пошёл.\n", "\n", "без табуляции\n", "a\tb\tc\n"]
+    assert list(cli.read_tsv(lines)) == [("Я пошел.", "Я пошёл."), ("a", "b")]
+    assert "line 3" in capsys.readouterr().err
+
+
+def test_read_parallel():
+    assert list(cli.read_parallel(["a\n", "b\n"], ["c\n", "d"])) == [("a", "c"), ("b", "d")]
+    with pytest.raises(ValueError, match="corrected file has fewer lines"):
+        list(cli.read_parallel(["a\n", "b\n"], ["c\n"]))
+    with pytest.raises(ValueError, match="original file has fewer lines"):
+        list(cli.read_parallel(["a\n"], ["c\n", "d\n"]))
+
+
+def test_apply_m2_edits():
+    orig = "Я пошол в магазин вчера .".split()
+    # A replacement, a deletion and an insertion, with the offsets of the original
+    edits = [(1, 2, "пошёл"), (4, 5, "-NONE-"), (5, 5, "утром")]
+    assert cli.apply_m2_edits(orig, edits) == "Я пошёл в магазин утром .".split()
+    assert cli.apply_m2_edits(orig, [(2, 4, "в большой магазин")]) == \
+        "Я пошол в большой магазин вчера .".split()
+
+
+def test_read_m2():
+    m2 = ["S Я пошол в магазин .\n",
+          "A 1 2|||Misspell|||пошёл|||REQUIRED|||-NONE-|||0\n",
+          "A 2 4|||Lex|||домой|||REQUIRED|||-NONE-|||1\n",
+          "\n",
+          "S Всё хорошо .\n",
+          "A -1 -1|||noop|||-NONE-|||REQUIRED|||-NONE-|||0\n",
+          "\n",
+          "S Он читал книгу\n",
+          "A 3 3|||Punct|||.|||REQUIRED|||-NONE-|||0\n"]
+    assert list(cli.read_m2(m2)) == [("Я пошол в магазин .", "Я пошёл в магазин ."),
+                                     ("Всё хорошо .", "Всё хорошо ."),
+                                     ("Он читал книгу", "Он читал книгу .")]
+    assert list(cli.read_m2(m2, annotator_id=1))[0] == ("Я пошол в магазин .", "Я пошол домой .")
+
+
+@pytest.fixture
+def edit():
+    orig = [Token(text, text, "X", {}, "dep") for text in ["Я", "пошол", "."]]
+    cor = [Token(text, text, "X", {}, "dep") for text in ["Я", "пошёл", "."]]
+    return Edit(orig, cor, (1, 2, 1, 2), "Misspell")
+
+
+def test_write_m2(edit):
+    out = io.StringIO()
+    cli.write_m2(out, ["Я", "пошол", "."], [edit])
+    cli.write_m2(out, ["Всё", "хорошо", "."], [])
+    assert out.getvalue() == ("S Я пошол .\n"
+                              "A 1 2|||Misspell|||пошёл|||REQUIRED|||-NONE-|||0\n"
+                              "\n"
+                              "S Всё хорошо .\n"
+                              "A -1 -1|||noop|||-NONE-|||REQUIRED|||-NONE-|||0\n"
+                              "\n")
+    # The written blocks are read back
+    lines = io.StringIO(out.getvalue()).readlines()
+    assert list(cli.read_m2(lines)) == [("Я пошол .", "Я пошёл ."), ("Всё хорошо .", "Всё хорошо .")]
+
+
+def test_write_jsonl(edit):
+    out = io.StringIO()
+    cli.write_jsonl(out, "Я пошол.", "Я пошёл.", [edit])
+    assert json.loads(out.getvalue()) == {
+        "orig": "Я пошол.", "cor": "Я пошёл.",
+        "edits": [{"o_start": 1, "o_end": 2, "o_str": "пошол", "c_start": 1, "c_end": 2,
+                   "c_str": "пошёл", "type": "Misspell"}]}
+
+
+def test_main(baseline, tmp_path, capsys):
+    pairs = baseline[:5]
+    path = tmp_path / "pairs.tsv"
+    path.write_text("".join("%s\t%s\n" % (pair["orig"], pair["cor"]) for pair in pairs), encoding="utf-8")
+    cli.main([str(path), "--output-format", "jsonl", "-o", str(tmp_path / "edits.jsonl")])
+    with open(tmp_path / "edits.jsonl", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert [[[e["o_start"], e["o_end"], e["c_start"], e["c_end"], e["type"]] for e in record["edits"]]
+            for record in records] == [pair["edits"]["rules"] for pair in pairs]
+
+    # Written to stdout, which stays open
+    cli.main([str(path)])
+    out = capsys.readouterr().out
+    assert sum(line.startswith("S ") for line in out.splitlines()) == len(pairs)
+    assert not sys.stdout.closed
@@ -0,0 +1,58 @@
+import pytest
+
+from annotator import Annotator
+from conftest import labelled
+from doc_store import DocStore
+
+attributes = ["start", "stop", "text", "id", "head_id", "rel", "pos", "feats", "lemma"]
+
+
+def token_attributes(doc):
+    return [[getattr(token, name) for name in attributes] for token in doc.tokens]
+
+
+@pytest.fixture
+def texts(baseline):
+    return [text for pair in baseline[:10] for text in (pair["orig"], pair["cor"])] + [""]
+
+
+def test_round_trip(annotator, texts, tmp_path):
+    docs = {text: annotator.process(text) for text in texts}
+    DocStore(str(tmp_path / "docs.sqlite")).put_many(docs)
+
+    store = DocStore(str(tmp_path / "docs.sqlite"))
+    loaded = store.get_many(texts)
+    assert set(loaded) == set(texts)
+    for text, doc in docs.items():
+        assert token_attributes(loaded[text]) == token_attributes(doc)
+        assert [(sent.start, sent.stop, sent.text) for sent in loaded[text].sents] == \
+            [(sent.start, sent.stop, sent.text) for sent in doc.sents]
+    assert store.store_info()["hits"] == len(set(texts))
+
+
+def test_other_models(annotator, texts, tmp_path):
+    DocStore(str(tmp_path / "docs.sqlite")).put_many({texts[0]: annotator.process(texts[0])})
+    store = DocStore(str(tmp_path / "docs.sqlite"))
+    store.version += ";natasha=other"
+    assert store.get_many([texts[0]]) == {}
+
+
+def test_rerun_skips_parsing(baseline, tmp_path, monkeypatch):
+    path = str(tmp_path / "docs.sqlite")
+    pairs = [(pair["orig"], pair["cor"]) for pair in baseline[:10]]
+    first = Annotator(store=path)
+    assert [labelled(edits) for edits in first.annotate_batch(pairs)] == \
+        [pair["edits"]["rules"] for pair in baseline[:10]]
+
+    second = Annotator(store=path)
+
+    def parse(*args):
+        raise AssertionError("parsed a stored text")
+
+    monkeypatch.setattr(second.processor, "parse", parse)
+    monkeypatch.setattr(second.processor, "parse_batch", parse)
+    assert [labelled(edits) for edits in second.annotate_batch(pairs)] == \
+        [pair["edits"]["rules"] for pair in baseline[:10]]
+    assert [labelled(second.annotate(orig, cor)) for orig, cor in pairs] == \
+        [pair["edits"]["rules"] for pair in baseline[:10]]
+    assert second.processor.store.store_info()["misses"] == 0
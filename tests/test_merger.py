@@ -0,0 +1,17 @@
+from conftest import merging_algorithms, spans
+
+
+def test_merging_matches_baseline(annotator, baseline):
+    for pair in baseline:
+        alignment = annotator.align(pair["orig"], pair["cor"])
+        for merging in merging_algorithms:
+            expected = [edit[:4] for edit in pair["edits"][merging]]
+            assert spans(annotator.merge(alignment, merging)) == expected, (pair["orig"], merging)
+
+
+def test_rule_merging_is_repeatable(annotator, baseline):
+    """ The spans memoized by the merger of an alignment must not change a second merge """
+    for pair in baseline[:10]:
+        alignment = annotator.align(pair["orig"], pair["cor"])
+        first = spans(annotator.merge(alignment))
+        assert spans(annotator.merge(alignment)) == first
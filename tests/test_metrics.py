@@ -0,0 +1,67 @@
+import json
+
+from annotator import Annotator
+from metrics import MetricsRegistry
+
+
+def test_hooks(baseline):
+    annotator = Annotator()
+    calls = []
+    hook = annotator.add_hook(lambda stage, seconds, counts: calls.append((stage, seconds, counts)))
+    pair = baseline[0]
+    edits = annotator.annotate(pair["orig"], pair["cor"])
+
+    stages = [stage for stage, _, _ in calls]
+    assert stages == ["process", "process", "align", "merge"] + ["classify"] * len(edits)
+    assert all(seconds >= 0 for _, seconds, _ in calls)
+    o_tokens = len(annotator.process(pair["orig"]).tokens)
+    c_tokens = len(annotator.process(pair["cor"]).tokens)
+    assert calls[0][2] == {"tokens": o_tokens}
+    assert calls[3][2] == {"tokens": o_tokens + c_tokens, "edits": len(edits)}
+
+    annotator.remove_hook(hook)
+    calls.clear()
+    annotator.annotate(pair["orig"], pair["cor"])
+    annotator.annotate_batch([(pair["orig"], pair["cor"])])
+    assert calls == []
+
+
+def test_batch_stages(baseline):
+    annotator = Annotator()
+    stages = []
+    annotator.add_hook(lambda stage, seconds, counts: stages.append(stage))
+    annotator.annotate_batch([(pair["orig"], pair["cor"]) for pair in baseline[:3]])
+    assert stages == ["process_batch"] + ["align", "merge"] * 3 + ["classify_batch"]
+
+
+def test_registry_exports(baseline):
+    registry = MetricsRegistry()
+    annotators = [Annotator(cache_size=10), Annotator(cache_size=10)]
+    for annotator in annotators:
+        registry.attach(annotator)
+    pairs = [(pair["orig"], pair["cor"]) for pair in baseline[:4]]
+    annotators[0].annotate_batch(pairs)
+    annotators[1].annotate_batch(pairs)
+    annotators[1].annotate_batch(pairs)
+
+    metrics = json.loads(registry.to_json())
+    assert set(metrics["stages"]) == {"process_batch", "align", "merge", "classify_batch"}
+    assert metrics["stages"]["merge"]["count"] == 12
+    assert metrics["stages"]["merge"]["buckets"]["+Inf"] == 12
+    assert metrics["edits_per_pair"]["count"] == 12
+    # The second batch of the second annotator is read from its cache
+    texts = len({text for pair in pairs for text in pair})
+    docs = metrics["caches"]["docs"]
+    assert (docs["hits"], docs["misses"]) == (texts, 2 * texts)
+    assert docs["hit_rate"] == 1 / 3
+
+    prometheus = registry.to_prometheus()
+    assert 'annotator_stage_seconds_bucket{stage="merge",le="+Inf"} 12' in prometheus
+    assert 'annotator_stage_seconds_count{stage="merge"} 12' in prometheus
+    assert "annotator_edits_per_pair_count 12" in prometheus
+    assert 'annotator_cache_hits_total{cache="docs"} %d' % texts in prometheus
+    assert 'annotator_cache_hit_ratio{cache="docs"} %s' % (1 / 3) in prometheus
+
+    registry.detach(annotators[0])
+    annotators[0].annotate_batch(pairs)
+    assert registry.to_dict()["stages"]["merge"]["count"] == 12
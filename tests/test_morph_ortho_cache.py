@@ -0,0 +1,75 @@
+import pytest
+
+import morph_ortho
+from morph_ortho import PredictionCache
+
+
+@pytest.fixture
+def model(monkeypatch, tmp_path):
+    """ A model labelling pairs of words of different lengths as Morph, with its predictions cached
+    in tmp_path. Returns the lists of pairs run through it """
+    runs = []
+
+    def run_model(pairs, batch_size=32):
+        runs.append(list(pairs))
+        return [("Morph",) if len(quote) != len(correction) else ("Ortho",) for quote, correction in pairs]
+
+    monkeypatch.setattr(morph_ortho, "run_model", run_model)
+    monkeypatch.setattr(morph_ortho, "checkpoint_fingerprint", lambda: "model-1")
+    monkeypatch.setattr(morph_ortho, "cache_path", str(tmp_path / "predictions.sqlite"))
+    monkeypatch.setattr(morph_ortho, "caches", {})
+    return runs
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "predictions.sqlite")
+    predictions = {("пошол", "пошёл"): ("Ortho",), ("хорошая", "хорошо"): ("Morph",),
+                   ("дом", "дома"): ("Ortho", "Morph"), ("и", "а"): ()}
+    PredictionCache(path, "model-1").put_many(predictions)
+
+    cache = PredictionCache(path, "model-1")
+    assert cache.get_many(list(predictions)) == predictions
+    assert cache.cache_info()["disk_hits"] == len(predictions)
+    # Read again from memory
+    assert cache.get_many(list(predictions)) == predictions
+    assert cache.cache_info()["memory_hits"] == len(predictions)
+
+
+def test_other_model(tmp_path):
+    path = str(tmp_path / "predictions.sqlite")
+    PredictionCache(path, "model-1").put_many({("пошол", "пошёл"): ("Ortho",)})
+    other = PredictionCache(path, "model-2")
+    assert other.get_many([("пошол", "пошёл")]) == {}
+    other.prune()
+    assert PredictionCache(path, "model-1").get_many([("пошол", "пошёл")]) == {}
+
+
+def test_memory_size():
+    cache = PredictionCache(None, None, memory_size=2)
+    cache.put_many({("a", "b"): ("Ortho",), ("c", "d"): ("Ortho",), ("e", "f"): ("Morph",)})
+    assert cache.get_many([("a", "b"), ("c", "d"), ("e", "f")]) == {("c", "d"): ("Ortho",),
+                                                                   ("e", "f"): ("Morph",)}
+
+
+def test_predict_runs_missing_pairs_once(model):
+    pairs = [("пошол", "пошёл"), ("хорошая", "хорошо"), ("пошол", "пошёл")]
+    labels = morph_ortho.predict(pairs)
+    assert labels == [("Ortho",), ("Morph",), ("Ortho",)]
+    assert model == [[("пошол", "пошёл"), ("хорошая", "хорошо")]]
+
+    # A new process reads the predictions from the file
+    morph_ortho.caches.clear()
+    assert morph_ortho.predict(pairs + [("дом", "дома")]) == labels + [("Morph",)]
+    assert model[1:] == [[("дом", "дома")]]
+
+
+def test_is_morph_batch(model):
+    with morph_ortho.MorphBatch() as batch:
+        assert not morph_ortho.is_morph("хорошая", "хорошо")
+        assert not morph_ortho.is_morph("пошол", "пошёл")
+        assert batch.deferred == 2 and model == []
+        batch.run()
+        assert morph_ortho.is_morph("хорошая", "хорошо")
+        assert not morph_ortho.is_morph("пошол", "пошёл")
+    assert morph_ortho.batch is None
+    assert model == [[("хорошая", "хорошо"), ("пошол", "пошёл")]]
@@ -0,0 +1,20 @@
+import sqlite3
+
+import parallel
+from conftest import labelled
+
+
+def test_calls_with_different_configs(baseline, tmp_path):
+    pairs = [(pair["orig"], pair["cor"]) for pair in baseline[:6]]
+    expected = [pair["edits"]["rules"] for pair in baseline[:6]]
+    results = parallel.annotate_parallel(pairs, processes=2, chunksize=2)
+    assert [labelled(edits) for edits in results] == expected
+
+    # The annotator preloaded by the first call must not be reused with another store
+    path = str(tmp_path / "docs.sqlite")
+    results = parallel.annotate_parallel(pairs, processes=2, chunksize=2, cache_size=10, store=path)
+    assert [labelled(edits) for edits in results] == expected
+    assert parallel.annotator_config == (10, path)
+    with sqlite3.connect(path) as db:
+        stored = db.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+    assert stored == len({text for pair in pairs for text in pair})
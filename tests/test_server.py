@@ -0,0 +1,90 @@
+import asyncio
+import json
+
+from server import AnnotationServer
+
+
+class Edit:
+    def __init__(self, orig, cor):
+        self.orig = orig
+        self.cor = cor
+
+    def to_dict(self):
+        return {"orig": self.orig, "cor": self.cor}
+
+
+class FailingAnnotator:
+    """ Fails the batches with an original starting with "fail" """
+
+    def __init__(self):
+        self.batches = []
+
+    def annotate_batch(self, pairs, batch_size=64, merging="rules"):
+        self.batches.append(list(pairs))
+        if any(orig.startswith("fail") for orig, _ in pairs):
+            raise ValueError("Cannot annotate")
+        return [[Edit(orig, cor)] for orig, cor in pairs]
+
+
+async def request(server, method, path, body=None):
+    """ Sends a request over TCP and returns the status and the decoded body """
+    port = server.server.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    data = json.dumps(body).encode() if body is not None else b""
+    writer.write(("%s %s HTTP/1.1\r\nContent-Length: %d\r\nConnection: close\r\n\r\n"
+                  % (method, path, len(data))).encode() + data)
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(body)
+
+
+def run(test, annotator, **options):
+    async def main():
+        server = AnnotationServer(annotator, **options)
+        await server.start(port=0)
+        try:
+            return await test(server)
+        finally:
+            await server.shutdown()
+    return asyncio.run(main())
+
+
+def test_failing_pair_is_isolated():
+    annotator = FailingAnnotator()
+
+    async def test(server):
+        return await asyncio.gather(
+            request(server, "POST", "/annotate", {"orig": "a", "cor": "b"}),
+            request(server, "POST", "/annotate", {"orig": "fail", "cor": "c"}),
+            request(server, "POST", "/annotate", {"pairs": [["d", "e"], ["f", "g"]]}))
+
+    ok, failed, pairs = run(test, annotator, max_wait=0.2)
+    # The three requests were batched together, then the pairs were annotated one by one
+    assert len(annotator.batches[0]) == 4
+    assert ok == (200, {"edits": [{"orig": "a", "cor": "b"}]})
+    assert failed == (500, {"error": "Cannot annotate"})
+    assert pairs == (200, {"results": [[{"orig": "d", "cor": "e"}], [{"orig": "f", "cor": "g"}]]})
+
+
+def test_invalid_requests():
+    async def test(server):
+        return [await request(server, "POST", "/annotate", body) for body in
+                [{"orig": 1, "cor": "b"}, {"orig": "a", "cor": None}, {"pairs": [["a", 2]]},
+                 {"pairs": "ab"}, {"pairs": [["a"]]}, {"orig": "a"},
+                 {"orig": "a", "cor": "b", "merging": "none"}, [1, 2], "x", 5, None]]
+
+    annotator = FailingAnnotator()
+    for status, response in run(test, annotator):
+        assert status == 400
+        assert "object has no attribute" not in response["error"]
+    assert annotator.batches == []
+
+
+def test_health_and_unknown_path():
+    async def test(server):
+        return (await request(server, "GET", "/health"), await request(server, "GET", "/nothing"))
+
+    health, unknown = run(test, FailingAnnotator())
+    assert health == (200, {"status": "ok", "queue": 0})
+    assert unknown[0] == 404
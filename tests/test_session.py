@@ -0,0 +1,72 @@
+import pytest
+
+from conftest import labelled
+
+essay = ("Я пошел в магазин.  Он был закрыт.\nМы вернулись домой. Вечером мы смотрел фильм. "
+         "Фильм был очень интересная.")
+correction = ("Я пошёл в магазин. Он был закрыт!\nМы вернулись домой вечером. Вечером мы смотрели фильм. "
+              "Фильм был очень интересный.")
+
+
+def token_attributes(tokens):
+    return [(token.text, token.start, token.stop, token.id, token.head_id) for token in tokens]
+
+
+def with_tokens(edits):
+    return [edit + [token_attributes(e.o_toks), token_attributes(e.c_toks)]
+            for edit, e in zip(labelled(edits), edits)]
+
+
+def test_update_matches_annotate(annotator):
+    session = annotator.session()
+    assert with_tokens(session.update(essay, correction)) == with_tokens(annotator.annotate(essay, correction))
+    assert session.stats == {"chunks": 5, "annotated": 5}
+
+
+def test_token_offsets(annotator, baseline):
+    """ Tokens of the edits have the offsets and the ids of the tokens of the whole texts """
+    pairs = baseline[:40]
+    for start in range(0, len(pairs), 8):
+        orig = " ".join(pair["orig"] for pair in pairs[start:start + 8])
+        cor = " ".join(pair["cor"] for pair in pairs[start:start + 8])
+        o_tokens = annotator.process(orig).tokens
+        c_tokens = annotator.process(cor).tokens
+        for edit in annotator.session().update(orig, cor):
+            assert token_attributes(edit.o_toks) == token_attributes(o_tokens[edit.o_start:edit.o_end])
+            assert token_attributes(edit.c_toks) == token_attributes(c_tokens[edit.c_start:edit.c_end])
+
+
+def test_only_changed_chunks_are_annotated(annotator):
+    session = annotator.session()
+    session.update(essay, correction)
+    edited = correction.replace("смотрели", "смотрел")
+    edits = session.update(essay, edited)
+    assert session.stats == {"chunks": 5, "annotated": 1}
+    assert with_tokens(edits) == with_tokens(annotator.annotate(essay, edited))
+    # Back to a version seen before: its chunk is annotated again, the others are kept
+    edits = session.update(essay, correction)
+    assert session.stats == {"chunks": 5, "annotated": 1}
+    assert with_tokens(edits) == with_tokens(annotator.annotate(essay, correction))
+    session.update(essay, correction)
+    assert session.stats == {"chunks": 5, "annotated": 0}
+
+
+@pytest.mark.parametrize("orig, cor, chunks", [
+    # A sentence split into two and two sentences merged into one
+    ("Я пришёл домой и я лёг спать. Было поздно.", "Я пришёл домой. Я лёг спать. Было поздно.", 2),
+    ("Я пришёл домой. Я лёг спать. Было поздно.", "Я пришёл домой и я лёг спать. Было поздно.", 2),
+    # An added and a deleted sentence, which join the chunk of a neighbouring sentence
+    ("Я пришёл домой. Было поздно.", "Я пришёл домой. Я лёг спать. Было поздно.", 2),
+    ("Я пришёл домой. Я лёг спать. Было поздно.", "Я пришёл домой. Было поздно.", 2),
+])
+def test_split_merged_added_deleted(annotator, orig, cor, chunks):
+    session = annotator.session()
+    edits = session.update(orig, cor)
+    assert session.stats["chunks"] == chunks
+    assert with_tokens(edits) == with_tokens(annotator.annotate(orig, cor))
+
+
+@pytest.mark.parametrize("orig, cor", [("", ""), ("", "Я пришёл домой."), ("Я пришёл домой.", "")])
+def test_empty_texts(annotator, orig, cor):
+    session = annotator.session()
+    assert labelled(session.update(orig, cor)) == labelled(annotator.annotate(orig, cor))
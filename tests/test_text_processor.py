@@ -0,0 +1,48 @@
+from text_processor import TextProcessor
+
+texts = ["Я пошёл домой.", "Было поздно.", "Мы смотрели фильм.", "Фильм был интересный."]
+
+
+def test_cache_counts():
+    processor = TextProcessor(cache_size=2)
+    a, b, c, _ = texts
+    first = processor.process(a)
+    processor.process(b)
+    # A hit makes a the most recently used, so c evicts b, then b evicts a
+    assert processor.process(a) is first
+    processor.process(c)
+    processor.process(b)
+    processor.process(c)
+    assert processor.cache_info() == {"hits": 2, "misses": 4, "evictions": 2, "size": 2, "max_size": 2}
+    assert list(processor.cache) == [b, c]
+
+
+def test_process_batch_deduplicates(monkeypatch):
+    processor = TextProcessor(cache_size=10)
+    parsed = []
+    parse_batch = processor.parse_batch
+
+    def record(batch, batch_size=64):
+        parsed.append(list(batch))
+        return parse_batch(batch, batch_size)
+
+    monkeypatch.setattr(processor, "parse_batch", record)
+    a, b, c, _ = texts
+    docs = processor.process_batch([a, b, a, a])
+    assert parsed == [[a, b]]
+    assert docs[0] is docs[2] is docs[3]
+    assert [doc.text for doc in docs] == [a, b, a, a]
+    assert processor.cache_info()["misses"] == 2
+
+    # Cached texts are not parsed again
+    docs = processor.process_batch([c, b, c])
+    assert parsed[1:] == [[c]]
+    assert docs[1] is processor.process(b)
+    assert processor.cache_info()["hits"] == 2
+
+
+def test_no_cache():
+    processor = TextProcessor()
+    processor.process(texts[0])
+    processor.process(texts[0])
+    assert processor.cache_info() == {"hits": 0, "misses": 0, "evictions": 0, "size": 0, "max_size": 0}
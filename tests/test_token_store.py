@@ -0,0 +1,94 @@
+import pickle
+
+import pytest
+
+import token_store
+from edit import Edit
+from token_store import Token, TokenStore, TokenTable, concat_stores
+
+attributes = ["text", "lemma", "pos", "feats", "rel", "start", "stop", "id", "head_id"]
+
+
+def token_attributes(tokens):
+    return [[getattr(token, name) for name in attributes] for token in tokens]
+
+
+@pytest.fixture(scope="module")
+def doc(annotator):
+    return annotator.process("Мы вчера ходили в кино. Фильм был очень интересный!")
+
+
+def test_store_keeps_tokens(doc):
+    store = TokenStore(doc.tokens)
+    assert len(store) == len(doc.tokens)
+    assert token_attributes(store.tokens(0, len(store))) == token_attributes(doc.tokens)
+    assert store.texts(2, 5) == [token.text for token in doc.tokens[2:5]]
+    assert store.text(0) == "Мы"
+    # Tokens are built again on every access
+    assert store.token(0) is not store.token(0)
+
+
+def test_missing_positions():
+    store = TokenStore([Token("дом", "дом", "NOUN", {}, "root")])
+    token = store.token(0)
+    assert (token.start, token.stop, token.id, token.head_id) == (-1, -1, None, None)
+
+
+def test_pickle(doc):
+    store = TokenStore(doc.tokens, TokenTable())
+    loaded = pickle.loads(pickle.dumps(store))
+    # Type ids are only valid in the table they were interned in, the tokens are interned again
+    assert loaded.table is not store.table
+    assert token_attributes(loaded.tokens(0, len(loaded))) == token_attributes(doc.tokens)
+
+    edit = Edit(store, store, (1, 3, 1, 2), "Lex")
+    loaded = pickle.loads(pickle.dumps(edit))
+    assert token_attributes(loaded.o_toks) == token_attributes(doc.tokens[1:3])
+    assert (loaded.o_str, loaded.c_str, loaded.type) == ("вчера ходили", "вчера", "Lex")
+
+
+def test_concat_stores(annotator, doc):
+    """ The sentences processed one by one and joined give the tokens of the whole text """
+    parts = [annotator.process(sent.text) for sent in doc.sents]
+    # The second part is interned in another table
+    stores = [TokenStore(parts[0].tokens), TokenStore(parts[1].tokens, TokenTable())]
+    store = concat_stores(stores, [[(0, sent.start)] for sent in doc.sents])
+    assert store.table is stores[0].table
+    assert token_attributes(store.tokens(0, len(store))) == token_attributes(doc.tokens)
+    assert len(concat_stores([])) == 0
+
+
+def test_table_rotation(monkeypatch, doc):
+    monkeypatch.setattr(token_store, "max_token_types", 5)
+    monkeypatch.setattr(token_store, "current_table", None)
+    first = TokenStore(doc.tokens[:3])
+    second = TokenStore(doc.tokens[3:6])
+    # The first table is full after the second store, the third store starts a new one
+    third = TokenStore(doc.tokens[6:])
+    assert first.table is second.table
+    assert len(first.table) == 6
+    assert third.table is not first.table
+    assert token_attributes(first.tokens(0, 3) + second.tokens(0, 3) + third.tokens(0, len(third))) == \
+        token_attributes(doc.tokens)
+
+
+def test_table_interns_types():
+    table = TokenTable()
+    a = table.id(Token("дом", "дом", "NOUN", {"Case": "Nom", "Number": "Sing"}, "nsubj"))
+    b = table.id(Token("дом", "дом", "NOUN", {"Number": "Sing", "Case": "Nom"}, "nsubj"))
+    c = table.id(Token("дом", "дом", "NOUN", {"Case": "Acc", "Number": "Sing"}, "obj"))
+    assert a == b != c
+    assert len(table) == 2
+
+
+def test_minimise(doc):
+    store = TokenStore(doc.tokens)
+    cor = TokenStore(doc.tokens[:3] + doc.tokens[4:])
+    # "ходили в кино" against "ходили кино": only the deleted token is kept
+    edit = Edit(store, cor, (2, 5, 2, 4)).minimise()
+    assert (edit.o_start, edit.o_end, edit.c_start, edit.c_end) == (3, 4, 3, 3)
+    assert token_attributes(edit.o_toks) == token_attributes(doc.tokens[3:4])
+    assert edit.c_toks == []
+    # An edit of equal spans is minimised to nothing
+    edit = Edit(store, store, (0, 4, 0, 4)).minimise()
+    assert (edit.o_start, edit.o_end, edit.c_start, edit.c_end) == (4, 4, 4, 4)
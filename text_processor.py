@@ -1,5 +1,7 @@
 """ Main class for processing text fed to the annotator using external libraries """
 
+from collections import OrderedDict
+from functools import cached_property
 
 from natasha import (
     Segmenter,
@@ -12,6 +14,9 @@ from natasha import (
 )
 from razdel import tokenize
 
+from doc_store import DocStore
+from resources import load
+
 
 class CyrLatSegmenter(Segmenter):
     def tokenize(self, text):
@@ -30,15 +35,88 @@ class CyrLatSegmenter(Segmenter):
             yield segment.adapt_token(t)
 
 
+def sent_words(sent):
+    return [token.text for token in sent.tokens]
+
+
+def set_batch_size(model, batch_size):
+    """ Changes the number of sentences a slovnet model encodes in one forward pass """
+    model.batch_size = batch_size
+    model.infer.encoder.batch_size = batch_size
+
+
 class TextProcessor:
-    def __init__(self):
-        self.emb = NewsEmbedding()
+    def __init__(self, cache_size=0, store=None):
+        # The models are loaded on first use, or all at once by warmup
         self.segmenter = CyrLatSegmenter()
-        self.morph_vocab = MorphVocab()
-        self.morph_tagger = NewsMorphTagger(self.emb)
-        self.syntax_parser = NewsSyntaxParser(self.emb)
+        # On-disk store of processed docs, see doc_store.DocStore
+        self.store = DocStore(store) if isinstance(store, str) else store
+
+        # LRU cache of processed docs keyed by text, disabled when cache_size is 0.
+        # Cached docs are shared between all their users and must not be modified.
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    @cached_property
+    def emb(self):
+        return load("NewsEmbedding", NewsEmbedding)
+
+    @cached_property
+    def morph_vocab(self):
+        return load("MorphVocab", MorphVocab)
+
+    @cached_property
+    def morph_tagger(self):
+        return load("NewsMorphTagger", lambda: NewsMorphTagger(self.emb))
+
+    @cached_property
+    def syntax_parser(self):
+        return load("NewsSyntaxParser", lambda: NewsSyntaxParser(self.emb))
+
+    def warmup(self):
+        """ Loads all the models now instead of on first use """
+        for name in ("morph_vocab", "morph_tagger", "syntax_parser"):
+            getattr(self, name)
+
+    def get_cached(self, text):
+        doc = self.cache.get(text)
+        if doc is None:
+            self.cache_stats["misses"] += 1
+        else:
+            self.cache_stats["hits"] += 1
+            self.cache.move_to_end(text)
+        return doc
+
+    def add_to_cache(self, text, doc):
+        self.cache[text] = doc
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+            self.cache_stats["evictions"] += 1
+
+    def cache_info(self):
+        """ Returns hit, miss and eviction counts of the doc cache along with its size """
+        return dict(self.cache_stats, size=len(self.cache), max_size=self.cache_size)
 
     def process(self, text):
+        if self.cache_size > 0:
+            doc = self.get_cached(text)
+            if doc is None:
+                doc = self.load_or_parse(text)
+                self.add_to_cache(text, doc)
+            return doc
+        return self.load_or_parse(text)
+
+    def load_or_parse(self, text):
+        if self.store is None:
+            return self.parse(text)
+        doc = self.store.get_many([text]).get(text)
+        if doc is None:
+            doc = self.parse(text)
+            self.store.put_many({text: doc})
+        return doc
+
+    def parse(self, text):
         doc = Doc(text)
         # Sentence is split into tokens
         doc.segment(self.segmenter)
@@ -51,3 +129,68 @@ class TextProcessor:
             for token in doc.tokens:
                 token.lemmatize(self.morph_vocab)
         return doc
+
+    def process_batch(self, texts, batch_size=64):
+        """ Processes several texts at once. Sentences of all the texts are
+        tagged and parsed together, batch_size sentences per forward pass """
+        if self.cache_size <= 0 and self.store is None:
+            return self.parse_batch(texts, batch_size)
+        docs = {}
+        missing = []
+        for text in texts:
+            if text not in docs:
+                docs[text] = self.get_cached(text) if self.cache_size > 0 else None
+                if docs[text] is None:
+                    missing.append(text)
+        for text, doc in self.load_or_parse_batch(missing, batch_size).items():
+            docs[text] = doc
+            if self.cache_size > 0:
+                self.add_to_cache(text, doc)
+        return [docs[text] for text in texts]
+
+    def load_or_parse_batch(self, texts, batch_size=64):
+        """ Returns docs by text, parsing only the texts missing from the store """
+        if self.store is None:
+            return dict(zip(texts, self.parse_batch(texts, batch_size)))
+        docs = self.store.get_many(texts)
+        missing = [text for text in texts if text not in docs]
+        if missing:
+            parsed = dict(zip(missing, self.parse_batch(missing, batch_size)))
+            self.store.put_many(parsed)
+            docs.update(parsed)
+        return docs
+
+    def parse_batch(self, texts, batch_size=64):
+        docs = []
+        sents = []
+        for text in texts:
+            doc = Doc(text)
+            doc.segment(self.segmenter)
+            docs.append(doc)
+            if len(doc.tokens) > 0:
+                sents.extend(enumerate(doc.sents, 1))
+        if not sents:
+            return docs
+
+        # Sentences of similar length are put together to reduce padding
+        sents.sort(key=lambda x: len(x[1].tokens))
+        chunk = [sent_words(sent) for _, sent in sents]
+        set_batch_size(self.morph_tagger, batch_size)
+        set_batch_size(self.syntax_parser, batch_size)
+        markups = self.morph_tagger.map(chunk)
+        for (_, sent), markup in zip(sents, markups):
+            for token, source in zip(sent.tokens, markup.tokens):
+                token.pos = source.pos
+                token.feats = source.feats
+        markups = self.syntax_parser.map(chunk)
+        for (sent_id, sent), markup in zip(sents, markups):
+            # Token ids are prefixed with the sentence number, as in Doc.parse_syntax
+            for token, source in zip(sent.tokens, markup.tokens):
+                token.id = '%s_%s' % (sent_id, source.id)
+                token.head_id = '%s_%s' % (sent_id, source.head_id)
+                token.rel = source.rel
+
+        for doc in docs:
+            for token in doc.tokens:
+                token.lemmatize(self.morph_vocab)
+        return docs
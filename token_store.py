@@ -0,0 +1,158 @@
+""" Compact storage of the tokens of a document, shared by the edits extracted from it """
+
+from array import array
+from bisect import bisect_right
+
+
+class Token:
+    """ A token with the attributes of a natasha token. The syntax ids of natasha,
+    "sentence_number", are built from the numbers on access """
+    __slots__ = ("text", "lemma", "pos", "feats", "rel", "start", "stop", "sent", "number", "head")
+
+    def __init__(self, text, lemma, pos, feats, rel, start=-1, stop=-1, sent=-1, number=-1, head=-1):
+        self.text = text
+        self.lemma = lemma
+        self.pos = pos
+        self.feats = feats
+        self.rel = rel
+        # Missing values are -1
+        self.start = start
+        self.stop = stop
+        self.sent = sent
+        self.number = number
+        self.head = head
+
+    @property
+    def id(self):
+        return None if self.sent < 0 else "%d_%d" % (self.sent, self.number)
+
+    @property
+    def head_id(self):
+        return None if self.sent < 0 else "%d_%d" % (self.sent, self.head)
+
+    def __repr__(self):
+        return "Token(%r, %r, %r)" % (self.text, self.lemma, self.pos)
+
+
+class TokenTable:
+    """ Token types, i.e. tokens with the same text and analysis, stored once and shared by
+    the documents interned in the table. The feats dicts are shared and must not be modified """
+    __slots__ = ("ids", "types")
+
+    def __init__(self):
+        self.ids = {}
+        self.types = []
+
+    def __len__(self):
+        return len(self.types)
+
+    def id(self, token):
+        feats = token.feats or {}
+        key = (token.text, token.lemma, token.pos, tuple(sorted(feats.items())), token.rel)
+        id = self.ids.get(key)
+        if id is None:
+            id = self.ids[key] = len(self.types)
+            self.types.append((token.text, token.lemma, token.pos, dict(feats), token.rel))
+        return id
+
+
+# New documents are interned in the current table until it has max_token_types types. Then a new
+# table is started, and the old one is freed with the last store that uses it, so a long-running
+# process does not keep the types of all the texts it has seen
+max_token_types = 100000
+current_table = None
+
+
+def get_table():
+    global current_table
+    if current_table is None or len(current_table) >= max_token_types:
+        current_table = TokenTable()
+    return current_table
+
+
+def encode_position(token):
+    """ Returns start, stop, sentence, number and head number of a token; natasha ids are
+    "sentence_number". Missing values are -1 """
+    start = getattr(token, "start", None)
+    stop = getattr(token, "stop", None)
+    sent, number, head = -1, -1, -1
+    id = getattr(token, "id", None)
+    head_id = getattr(token, "head_id", None)
+    if isinstance(id, str) and isinstance(head_id, str):
+        id_sent, _, id_number = id.partition("_")
+        head_sent, _, head_number = head_id.partition("_")
+        if id_sent == head_sent and id_sent.isdigit() and id_number.isdigit() and head_number.isdigit():
+            sent, number, head = int(id_sent), int(id_number), int(head_number)
+    return (-1 if start is None else start, -1 if stop is None else stop, sent, number, head)
+
+
+class TokenStore:
+    """ Ids of the token types of a document, 4 bytes per token, with the offsets
+    and syntax ids of the tokens, 20 bytes per token """
+    __slots__ = ("table", "type_ids", "positions")
+
+    # Numbers stored in positions per token
+    width = 5
+
+    def __init__(self, doc_tokens=(), table=None):
+        self.table = table if table is not None else get_table()
+        self.type_ids = array("i")
+        self.positions = array("i")
+        for token in doc_tokens:
+            self.type_ids.append(self.table.id(token))
+            self.positions.extend(encode_position(token))
+
+    def __len__(self):
+        return len(self.type_ids)
+
+    def __reduce__(self):
+        # Ids are only valid in the process that assigned them, so the tokens are sent instead
+        return TokenStore, (self.tokens(0, len(self)),)
+
+    def text(self, n):
+        return self.table.types[self.type_ids[n]][0]
+
+    def token(self, n):
+        text, lemma, pos, feats, rel = self.table.types[self.type_ids[n]]
+        return Token(text, lemma, pos, feats, rel, *self.positions[n * self.width:(n + 1) * self.width])
+
+    def tokens(self, start, end):
+        return [self.token(n) for n in range(start, min(end, len(self)))]
+
+    def texts(self, start, end):
+        types = self.table.types
+        return [types[id][0] for id in self.type_ids[start:end]]
+
+
+def concat_stores(stores, char_offsets=None):
+    """ Joins the token stores of consecutive parts of a document. The sentence numbers of a part
+    follow those of the parts before it. char_offsets has, for every part, the (offset in the part,
+    offset in the document) pairs of the starts of its segments in increasing order, the character
+    offsets of the tokens of a segment are moved from the first to the second """
+    store = TokenStore()
+    sent_shift = 0
+    width = TokenStore.width
+    for n, part in enumerate(stores):
+        if part.table is store.table:
+            store.type_ids.extend(part.type_ids)
+        else:
+            for id in part.type_ids:
+                text, lemma, pos, feats, rel = part.table.types[id]
+                store.type_ids.append(store.table.id(Token(text, lemma, pos, feats, rel)))
+        segments = char_offsets[n] if char_offsets is not None else [(0, 0)]
+        part_starts = [start for start, _ in segments]
+        last_sent = 0
+        positions = part.positions
+        for k in range(0, len(positions), width):
+            start, stop, sent, number, head = positions[k:k + width]
+            if start >= 0 and segments:
+                part_start, doc_start = segments[max(bisect_right(part_starts, start) - 1, 0)]
+                start += doc_start - part_start
+                if stop >= 0:
+                    stop += doc_start - part_start
+            if sent >= 0:
+                last_sent = max(last_sent, sent)
+                sent += sent_shift
+            store.positions.extend((start, stop, sent, number, head))
+        sent_shift += last_sent
+    return store